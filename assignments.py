@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
-import requests
 import json
 import os
 import sys
 from datetime import datetime
+from utils.http_client import canvas_get, iter_canvas_items
 
 # Hardcoded credentials - can be filled in directly here
 HARDCODED_CREDENTIALS = {
@@ -88,11 +88,13 @@ def get_course_id(api_key, domain, course_name=None):
         "include": ["total_scores"]
     }
     
-    response = requests.get(url, headers=headers, params=params)
+    try:
+        courses = list(iter_canvas_items(domain, url, headers=headers, params=params))
+    except Exception as e:
+        print(f"⚠️ Request error: {str(e)} for {url}")
+        courses = []
     
-    if response.status_code == 200:
-        courses = response.json()
-        
+    if courses:
         # If course name specified, search for it
         if course_name:
             for course in courses:
@@ -116,43 +118,40 @@ def get_assignments(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/assignments"
     
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        return response.json()
-    
-    return []
+    try:
+        return list(iter_canvas_items(domain, url, headers=headers))
+    except Exception as e:
+        print(f"⚠️ Request error: {str(e)} for {url}")
+        return []
 
 # Get quizzes for a course
 def get_quizzes(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/quizzes"
     
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        return response.json()
-    
-    return []
+    try:
+        return list(iter_canvas_items(domain, url, headers=headers))
+    except Exception as e:
+        print(f"⚠️ Request error: {str(e)} for {url}")
+        return []
 
 # Get discussions for a course
 def get_discussions(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/discussion_topics"
     
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        return response.json()
-    
-    return []
+    try:
+        return list(iter_canvas_items(domain, url, headers=headers))
+    except Exception as e:
+        print(f"⚠️ Request error: {str(e)} for {url}")
+        return []
 
 # Get submission status for assignments
 def get_submission_status(api_key, domain, course_id, assignment_id, user_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/assignments/{assignment_id}/submissions/{user_id}"
     
-    response = requests.get(url, headers=headers)
+    response = canvas_get(domain, url, headers=headers)
     
     if response.status_code == 200:
         return response.json()
@@ -165,7 +164,7 @@ def get_quiz_submission_status(api_key, domain, course_id, quiz_id, user_id):
     url = f"https://{domain}/api/v1/courses/{course_id}/quizzes/{quiz_id}/submissions"
     params = {"user_id": user_id}
     
-    response = requests.get(url, headers=headers, params=params)
+    response = canvas_get(domain, url, headers=headers, params=params)
     
     if response.status_code == 200:
         data = response.json()
@@ -179,14 +178,13 @@ def get_discussion_participation(api_key, domain, course_id, discussion_id, user
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/discussion_topics/{discussion_id}/entries"
     
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        entries = response.json()
-        # Check if user has participated
-        for entry in entries:
+    try:
+        # Check if user has participated, stopping at the first matching entry
+        for entry in iter_canvas_items(domain, url, headers=headers):
             if str(entry.get("user_id")) == str(user_id):
                 return {"participated": True, "entry": entry}
+    except Exception as e:
+        print(f"⚠️ Request error: {str(e)} for {url}")
     
     return {"participated": False, "entry": None}
 
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark peak memory of NotionFormatter.transform_long_to_wide on long grade histories
+Generates synthetic grades.csv files of increasing length and runs the formatter on each
+in a fresh process, streaming in chunks and (optionally) loading the whole file, so the
+peak RSS of the two modes can be compared as the history grows.
+
+Example:
+    python benchmarks/streaming_formatter.py --rows 1000000 3000000 10000000
+"""
+
+import argparse
+import csv
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import COURSE_NAME_TO_CHINESE
+from utils.csv_handler import GRADE_FIELDNAMES
+
+def generate_history(path: str, rows: int, students: int, seed: int = 0) -> None:
+    """Write a synthetic grades.csv: one record per student and course per run, runs 15 minutes apart"""
+    rng = random.Random(seed)
+    courses = list(COURSE_NAME_TO_CHINESE.items())
+    runs = max(1, rows // (students * len(courses)))
+    start = datetime(2025, 1, 1)
+
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(GRADE_FIELDNAMES)
+        for run in range(runs):
+            fetch_time = (start + timedelta(minutes=15 * run)).strftime("%Y-%m-%d %H:%M:%S")
+            for student in range(students):
+                for course_name, course_name_chinese in courses:
+                    if written >= rows:
+                        return
+                    score = round(rng.uniform(50, 100), 2)
+                    writer.writerow([
+                        f"Student {student}", f"学生{student}", f"S{student}",
+                        course_name, course_name_chinese, score, "A" if score >= 90 else "B", fetch_time
+                    ])
+                    written += 1
+
+def measure(input_path: str, chunk_rows: int) -> None:
+    """Run the formatter once in this process and print elapsed seconds and peak RSS (MB)"""
+    from notion_processor.utils.notion_formatter import NotionFormatter
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output_path = os.path.join(os.path.dirname(input_path), f"notion_grades_{chunk_rows}.csv")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    started = time.perf_counter()
+    NotionFormatter(input_path, output_path, chunk_rows=chunk_rows).transform_long_to_wide()
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"RESULT {elapsed:.2f} {peak / scale:.1f} {(peak - baseline) / scale:.1f}")
+
+def run_case(input_path: str, chunk_rows: int) -> str:
+    """Measure one formatter run in a child process so every case starts from a clean heap"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", input_path, "--chunk-rows", str(chunk_rows)],
+        capture_output=True, text=True, cwd=os.path.dirname(input_path)
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("RESULT "):
+            elapsed, peak, growth = line.split()[1:]
+            return f"{float(elapsed):>9.2f}s {float(peak):>9.1f} MB {float(growth):>9.1f} MB"
+    return f"failed: {(result.stderr or result.stdout).strip().splitlines()[-1:]}"
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark formatter memory on long grade histories")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 3000000, 10000000],
+                        help="History lengths to generate")
+    parser.add_argument("--students", type=int, default=200, help="Students in the synthetic cohort")
+    parser.add_argument("--chunk-rows", type=int, default=200000, help="Rows per chunk in streaming mode")
+    parser.add_argument("--skip-full", action="store_true", help="Only run the streaming mode")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated files")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.chunk_rows)
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix="grades_benchmark_")
+    print(f"📁 Working directory: {work_dir}")
+    print(f"{'rows':>12} {'mode':>10} {'time':>10} {'peak RSS':>12} {'growth':>12}")
+    try:
+        for rows in args.rows:
+            input_path = os.path.join(work_dir, f"grades_{rows}.csv")
+            generate_history(input_path, rows, args.students)
+            modes = [("stream", args.chunk_rows)] + ([] if args.skip_full else [("full", 0)])
+            for mode, chunk_rows in modes:
+                print(f"{rows:>12} {mode:>10} {run_case(input_path, chunk_rows)}", flush=True)
+            if not args.keep:
+                os.remove(input_path)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -3,6 +3,10 @@ import requests
 import json
 import os
 from datetime import datetime
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+# (connect, read) timeouts so a hung Canvas socket cannot stall the script
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
 
 # Load credentials
 def load_credentials():
@@ -25,7 +29,7 @@ def get_music_appreciation_course_id(api_key, domain):
         "include": ["total_scores"]
     }
     
-    response = requests.get(url, headers=headers, params=params)
+    response = requests.get(url, headers=headers, params=params, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         courses = response.json()
@@ -40,7 +44,7 @@ def get_assignments(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/assignments"
     
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -52,7 +56,7 @@ def get_quizzes(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/quizzes"
     
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -64,7 +68,7 @@ def get_discussions(api_key, domain, course_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/discussion_topics"
     
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -76,7 +80,7 @@ def get_submission_status(api_key, domain, course_id, assignment_id, user_id):
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/assignments/{assignment_id}/submissions/{user_id}"
     
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -89,7 +93,7 @@ def get_quiz_submission_status(api_key, domain, course_id, quiz_id, user_id):
     url = f"https://{domain}/api/v1/courses/{course_id}/quizzes/{quiz_id}/submissions"
     params = {"user_id": user_id}
     
-    response = requests.get(url, headers=headers, params=params)
+    response = requests.get(url, headers=headers, params=params, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         data = response.json()
@@ -103,7 +107,7 @@ def get_discussion_participation(api_key, domain, course_id, discussion_id, user
     headers = {"Authorization": f"Bearer {api_key}"}
     url = f"https://{domain}/api/v1/courses/{course_id}/discussion_topics/{discussion_id}/entries"
     
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         entries = response.json()
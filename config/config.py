@@ -9,6 +9,61 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 # Path to credentials file (stored outside version control)
 CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE", os.path.join(os.path.dirname(__file__), "credentials.json"))
 
+# Number of students collected concurrently (1 = serial collection)
+COLLECTION_MAX_WORKERS = int(os.getenv("COLLECTION_MAX_WORKERS", "8"))
+
+# Keep-alive connections per Canvas domain (at least one per worker)
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", str(max(10, COLLECTION_MAX_WORKERS))))
+
+# Page size requested from Canvas list endpoints (Canvas caps this at 100)
+CANVAS_PER_PAGE = int(os.getenv("CANVAS_PER_PAGE", "100"))
+
+# Canvas rate limiting (per API token): bucket size, refill per second, and
+# the budget kept in reserve so concurrent requests are never throttled
+CANVAS_RATE_LIMIT_CAPACITY = float(os.getenv("CANVAS_RATE_LIMIT_CAPACITY", "700"))
+CANVAS_RATE_LIMIT_LEAK_RATE = float(os.getenv("CANVAS_RATE_LIMIT_LEAK_RATE", "10"))
+CANVAS_RATE_LIMIT_RESERVE = float(os.getenv("CANVAS_RATE_LIMIT_RESERVE", "100"))
+
+# Retries for idempotent Canvas requests (exponential backoff with jitter, in seconds)
+CANVAS_RETRY_MAX_ATTEMPTS = int(os.getenv("CANVAS_RETRY_MAX_ATTEMPTS", "4"))
+CANVAS_RETRY_BASE_DELAY = float(os.getenv("CANVAS_RETRY_BASE_DELAY", "0.5"))
+CANVAS_RETRY_MAX_DELAY = float(os.getenv("CANVAS_RETRY_MAX_DELAY", "30"))
+
+# Per-domain circuit breaker: consecutive failures before failing fast, and
+# seconds to wait before probing the domain again
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "60"))
+
+# Per-request timeouts in seconds, and the deadline for collecting all students (0 = no deadline)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "1800"))
+
+# On-disk Canvas response cache, revalidated with ETag/Last-Modified once an entry is stale
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", os.path.join("data", "http_cache.sqlite"))
+
+# Cache TTLs in seconds per Canvas endpoint. The course list carries current
+# scores, so it is always revalidated (TTL 0) and only the body download is saved.
+CANVAS_CACHE_TTLS = {
+    "users/self/profile": float(os.getenv("HTTP_CACHE_TTL_PROFILE", str(7 * 24 * 3600))),
+    "courses": float(os.getenv("HTTP_CACHE_TTL_COURSES", "0")),
+    "courses/*": float(os.getenv("HTTP_CACHE_TTL_COURSE_DETAILS", str(30 * 24 * 3600)))
+}
+
+# Enrollment terms to collect. Leave CANVAS_TERM_IDS empty to resolve the terms
+# in session (within the grace period) from each student's courses; list several ids, e.g.
+# "118,121", to collect more than one term during transition weeks.
+CANVAS_TERM_IDS = [int(term_id) for term_id in os.getenv("CANVAS_TERM_IDS", "").split(",") if term_id.strip()]
+CANVAS_TERM_GRACE_DAYS = int(os.getenv("CANVAS_TERM_GRACE_DAYS", "7"))
+CANVAS_TERM_CACHE_TTL = float(os.getenv("CANVAS_TERM_CACHE_TTL", str(24 * 3600)))
+CANVAS_TERM_CACHE_PATH = os.getenv("CANVAS_TERM_CACHE_PATH", os.path.join("data", "canvas_terms.json"))
+
+# How grades are collected: "courses" (profile + course list with total_scores),
+# "enrollments" (one paginated enrollments stream, names from one course list joined locally)
+# or "graphql" (one Canvas GraphQL query per student)
+GRADES_COLLECTION_MODE = os.getenv("GRADES_COLLECTION_MODE", "courses")
+
 # Function to load all student credentials
 def load_student_credentials():
     """Load student credentials from JSON file"""
@@ -75,72 +130,25 @@ def get_user_id_for_student(student_id):
     except ValueError:
         raise ValueError(f"User ID must be a valid integer for student ID: {student_id}")
 
-# Student Name Mappings (from credentials.json)
-def build_student_mappings():
-    student_to_chinese = {}
-    student_to_english = {}
-    
-    for student_name, data in STUDENT_CREDENTIALS.items():
-        # Get the data from credentials
-        canvas_name = data.get("student_name", student_name)
-        chinese_name = data.get("student_chinese_name", "")
-        english_name = data.get("student_english_name", "")
-        
-        # Base mappings
-        if canvas_name:
-            student_to_chinese[canvas_name] = chinese_name
-            student_to_english[canvas_name] = english_name
-        
-        # Add English name as a key for lookups
-        if english_name:
-            student_to_chinese[english_name] = chinese_name
-            student_to_english[english_name] = english_name
-            
-            # Clean English name (first name only)
-            english_name_clean = english_name.split()[0] if ' ' in english_name else english_name
-            student_to_chinese[english_name_clean] = chinese_name
-            student_to_english[english_name_clean] = english_name
-        
-        # Handle typical Canvas name format: English name + Last name
-        # Extract last name from Canvas name (which is often in "First Last" format)
-        if canvas_name and " " in canvas_name:
-            last_name = canvas_name.split()[-1]
-            
-            # Map "English Last" to the student
-            if english_name:
-                # Map both formats: "English Last" and just "English"
-                english_first_name = english_name.split()[0] if ' ' in english_name else english_name
-                english_last_combo = f"{english_first_name} {last_name}"
-                
-                student_to_chinese[english_last_combo] = chinese_name
-                student_to_english[english_last_combo] = english_name
-        
-        # Directly map Jason Jiang to the right student (specific fixes)
-        if english_name == "Jason" and "Jiang" in student_name:
-            student_to_chinese["Jason Jiang"] = chinese_name
-            student_to_english["Jason Jiang"] = english_name
-            
-        # Map other problematic students directly
-        problem_students = {
-            "Ryan Xu": ("Xu Ruijian", "Ryan"),
-            "Queenie Guo": ("Guo Zirui", "Queenie"),
-            "Peter Deng": ("Deng Caihaoxuan", "Peter"),
-            "Nora Guo": ("Guo Yuhan", "Nora"),
-            "Mia Fan": ("Fan Xingzhu", "Mia"),
-            "Kyler Yuan": ("Yuan Man", "Kyler"),
-            "Jonathan Hu": ("Hu Kaifeng", "Jonathan"),
-            "Jerry Ren": ("Ren Xizhi", "Jerry"),
-            "Gavin Wang": ("Wang Zhiyu", "Gavin")
-        }
-        
-        for canvas_format, (_, en_name) in problem_students.items():
-            if english_name == en_name:
-                student_to_chinese[canvas_format] = chinese_name
-                student_to_english[canvas_format] = english_name
-    
-    return student_to_chinese, student_to_english
+# Student name aliases: a name form seen in Canvas or reports -> a name the student
+# already resolves by in credentials.json (English name, Canvas name or credentials key).
+# Canvas names, English names, first names and "English Last" forms are indexed
+# automatically by utils/student_identity.py; list only the forms it cannot derive.
+STUDENT_NAME_ALIASES = {
+    "Jason Jiang": "Jason",
+    "Ryan Xu": "Ryan",
+    "Queenie Guo": "Queenie",
+    "Peter Deng": "Peter",
+    "Nora Guo": "Nora",
+    "Mia Fan": "Mia",
+    "Kyler Yuan": "Kyler",
+    "Jonathan Hu": "Jonathan",
+    "Jerry Ren": "Jerry",
+    "Gavin Wang": "Gavin"
+}
 
-STUDENT_TO_CHINESE_NAME, STUDENT_TO_PREFERRED_ENGLISH_NAME = build_student_mappings()
+# Student identity index cache, rebuilt whenever credentials.json or the aliases change
+STUDENT_INDEX_CACHE_PATH = os.getenv("STUDENT_INDEX_CACHE_PATH", os.path.join("data", "student_index.json"))
 
 # Course Mappings (from canvas_grade.py)
 COURSE_NAME_TO_CHINESE = {
@@ -190,5 +198,47 @@ def convert_score_to_grade(score):
 
 # CSV File Configuration
 GRADES_CSV_PATH = os.path.join("data", "grades.csv")
+# Grade history layout: "single" appends to grades.csv, "partitioned" writes gzip day
+# partitions under GRADES_PARTITION_DIR (compacted into monthly files); an existing
+# grades.csv is split into partitions the first time the partitioned layout is used
+GRADES_HISTORY_LAYOUT = os.getenv("GRADES_HISTORY_LAYOUT", "single")
+GRADES_PARTITION_DIR = os.getenv("GRADES_PARTITION_DIR", os.path.join("data", "grades"))
+# Days of history the Notion formatter reads when falling back to the history files (0 = all)
+GRADES_LOOKBACK_DAYS = int(os.getenv("GRADES_LOOKBACK_DAYS", "30"))
+# Write a Parquet copy next to grades/notion CSVs for faster typed loading (needs pyarrow)
+GRADES_PARQUET_MIRROR = os.getenv("GRADES_PARQUET_MIRROR", "true").lower() == "true"
+# Rows per chunk when the Notion formatter streams a single grades.csv (0 = load the whole file)
+GRADES_READ_CHUNK_ROWS = int(os.getenv("GRADES_READ_CHUNK_ROWS", "200000"))
+# Records buffered in memory before spilling to a temp file until the run's single commit
+GRADES_BUFFER_SPILL_ROWS = int(os.getenv("GRADES_BUFFER_SPILL_ROWS", "50000"))
+# SQLite grade history written alongside grades.csv (see utils/grade_store.py)
+GRADES_DB_PATH = os.getenv("GRADES_DB_PATH", os.path.join("data", "grades.sqlite"))
+# "changes" stores a row only when a score or grade changes (unchanged runs extend
+# the row's last_seen); "full" stores every collected record
+GRADES_HISTORY_MODE = os.getenv("GRADES_HISTORY_MODE", "changes")
 ASSIGNMENTS_CSV_PATH = os.path.join("data", "assignments.csv")
 NOTION_GRADES_CSV_PATH = os.path.join("notion_processor", "data", "notion_grades.csv")
+# "rewrite" rewrites notion_grades.csv with one row per student and an Is Latest Batch column
+# every run; "incremental" appends each batch, keeps the latest-batch pointer in
+# notion_grades.latest.json and the one-row-per-student view in notion_grades.latest.csv
+NOTION_GRADES_OUTPUT_MODE = os.getenv("NOTION_GRADES_OUTPUT_MODE", "rewrite")
+# Notion uploads: "async" creates pages concurrently through notion_client.AsyncClient,
+# "sync" creates them one at a time
+NOTION_UPLOAD_MODE = os.getenv("NOTION_UPLOAD_MODE", "async")
+# "append" creates a new page for every student every run (the page history is kept); "diff"
+# (opt-in) keeps one page per student, edits it in place and writes only students whose
+# properties differ from the page stored in the Notion mirror (requires NOTION_MIRROR_PATH)
+NOTION_SYNC_MODE = os.getenv("NOTION_SYNC_MODE", "append")
+# SQLite mirror of the Notion database, refreshed with a last_edited_time delta each run and
+# used for student and latest-batch lookups and diff sync (empty = query Notion directly)
+NOTION_MIRROR_PATH = os.getenv("NOTION_MIRROR_PATH", os.path.join("notion_processor", "data", "notion_mirror.sqlite"))
+# How the latest batch is marked in append sync mode: "flags" resets Is Latest Batch on the
+# previous batch's pages every run; "pointer" writes the batch id to one control page
+# (NOTION_BATCH_CONTROL_PAGE_ID, set up with notion_processor/utils/notion_api/batch_pointer.py migrate)
+NOTION_LATEST_BATCH_MODE = os.getenv("NOTION_LATEST_BATCH_MODE", "flags")
+NOTION_BATCH_CONTROL_PAGE_ID = os.getenv("NOTION_BATCH_CONTROL_PAGE_ID", "")
+# Requests in flight, request starts per second (0 = no pacing; Notion averages about 3/s
+# but allows bursts, and a 429 pauses every request for its Retry-After) and retries per request
+NOTION_MAX_CONCURRENCY = int(os.getenv("NOTION_MAX_CONCURRENCY", "4"))
+NOTION_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", "0"))
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
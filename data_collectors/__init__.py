@@ -0,0 +1,16 @@
+from data_collectors.grades import GradesCollector
+from data_collectors.enrollment_grades import EnrollmentGradesCollector
+from data_collectors.graphql_grades import GraphQLGradesCollector
+
+# Grades collection strategies, selected by GRADES_COLLECTION_MODE
+GRADES_COLLECTORS = {
+    "courses": GradesCollector,
+    "enrollments": EnrollmentGradesCollector,
+    "graphql": GraphQLGradesCollector
+}
+
+def get_grades_collector_class(mode: str):
+    """Get the grades collector class for a collection mode"""
+    if mode not in GRADES_COLLECTORS:
+        raise ValueError(f"Unknown grades collection mode: {mode} (expected one of: {', '.join(GRADES_COLLECTORS)})")
+    return GRADES_COLLECTORS[mode]
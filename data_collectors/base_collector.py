@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
-import requests
 from datetime import datetime
-from typing import Dict, Any, Optional, List
-from utils.error_handler import handle_api_error
+from typing import Dict, Any, Optional, List, Iterator
+from utils.error_handler import handle_api_error, DeadlineExceededError
+from utils.http_client import canvas_get, canvas_post, iter_canvas_items
 
 class BaseCollector(ABC):
     def __init__(self, student_name: str, api_key: str, domain: str, user_id: int):
@@ -21,7 +21,7 @@ class BaseCollector(ABC):
             if params:
                 print(f"With parameters: {params}")
             
-            response = requests.get(url, headers=self.headers, params=params)
+            response = canvas_get(self.domain, url, headers=self.headers, params=params)
             
             if response.status_code == 200:
                 return response.json()
@@ -29,10 +29,59 @@ class BaseCollector(ABC):
                 print(f"⚠️ API error: {response.status_code} for {url}")
                 return None
                 
+        except DeadlineExceededError:
+            # Let the run cancel this student instead of saving partial data
+            raise
         except Exception as e:
             print(f"⚠️ Request error: {str(e)} for {url}")
             return None
 
+    def _make_graphql_request(self, query: str, variables: Optional[Dict] = None) -> Optional[Dict]:
+        """Run a read-only query against the Canvas GraphQL API and return its data"""
+        url = f"{self.base_url.rsplit('/v1', 1)[0]}/graphql"
+        try:
+            print(f"Making GraphQL request to: {url}")
+
+            response = canvas_post(self.domain, url, headers=self.headers,
+                                   json={"query": query, "variables": variables or {}}, idempotent=True)
+
+            if response.status_code != 200:
+                print(f"⚠️ API error: {response.status_code} for {url}")
+                return None
+
+            result = response.json()
+            if result.get("errors"):
+                print(f"⚠️ GraphQL errors: {result['errors']} for {url}")
+            return result.get("data")
+
+        except DeadlineExceededError:
+            # Let the run cancel this student instead of saving partial data
+            raise
+        except Exception as e:
+            print(f"⚠️ Request error: {str(e)} for {url}")
+            return None
+
+    def _paginate(self, endpoint: str, params: Optional[Dict] = None) -> Iterator[Any]:
+        """
+        Yield every item of a Canvas list endpoint, one page at a time.
+        A failed page raises, so the student is reported as failed instead of
+        being saved with the items of the pages that did arrive.
+        """
+        url = f"{self.base_url}/{endpoint}"
+        try:
+            print(f"Making paginated API request to: {url}")
+            if params:
+                print(f"With parameters: {params}")
+
+            yield from iter_canvas_items(self.domain, url, headers=self.headers, params=params)
+
+        except DeadlineExceededError:
+            # Let the run cancel this student instead of saving partial data
+            raise
+        except Exception as e:
+            print(f"⚠️ Request error: {str(e)} for {url}")
+            raise
+
     def get_student_name(self) -> str:
         """Get student name from Canvas API matching canvas_grade.py"""
         # Use exact same endpoint as in canvas_grade.py
@@ -0,0 +1,65 @@
+from typing import Dict, Iterable, List, Optional
+from data_collectors.grades import GradesCollector
+from utils.error_handler import logger
+
+class EnrollmentGradesCollector(GradesCollector):
+    """
+    Collect grades from the student's enrollments instead of the course list.
+
+    One paginated users/self/enrollments stream per collected term returns
+    every score, filtered by Canvas with enrollment_term_id. Course names come
+    from one course list per student (without scores), joined locally by
+    course id; only a course missing from that list is fetched on its own
+    from courses/:id, which is cached for weeks.
+    """
+
+    def get_enrolled_courses(self) -> List[Dict]:
+        """Get all courses the student is enrolled in, with the enrollment's grades attached"""
+        url = "users/self/enrollments"
+        params = {
+            "type[]": ["StudentEnrollment"],
+            "state[]": ["active"]
+        }
+        term_ids = self.get_term_ids()
+        if term_ids is None:
+            return [
+                course for course in self.get_courses_for_enrollments(self._paginate(url, params))
+                if self.is_2025s_course(course.get("name", ""))
+            ]
+
+        # Canvas filters by term on the server, one term per request
+        enrollments = []
+        for term_id in term_ids:
+            term_params = {**params, "enrollment_term_id": term_id}
+            enrollments.extend(self._paginate(url, term_params))
+        return self.get_courses_for_enrollments(enrollments)
+
+    def get_course_index(self) -> Dict[int, Dict]:
+        """Get the metadata of every course the student is enrolled in, by course id, in one list request"""
+        params = {"enrollment_state": "active", "include": ["term"]}
+        return {course["id"]: course for course in self._paginate("courses", params) if "id" in course}
+
+    def get_courses_for_enrollments(self, enrollments: Iterable[Dict]) -> List[Dict]:
+        """Attach each enrollment to its course metadata"""
+        enrollments = list(enrollments)
+        if not enrollments:
+            return []
+
+        course_index = self.get_course_index()
+        courses = []
+        for enrollment in enrollments:
+            course_id = enrollment.get("course_id")
+            course = course_index.get(course_id) or self.get_course(course_id)
+            if course:
+                # Same shape as a course returned with include=total_scores
+                courses.append({**course, "enrollments": [enrollment]})
+            else:
+                print(f"⚠️ Dropping enrollment in course {course_id} for {self.student_name}: course not found")
+                logger.warning(f"Dropped enrollment in course {course_id} for {self.student_name}: course not found")
+        return courses
+
+    def get_course(self, course_id: Optional[int]) -> Optional[Dict]:
+        """Get one course's metadata (served from the response cache after the first run)"""
+        if course_id is None:
+            return None
+        return self._make_request(f"courses/{course_id}")
@@ -1,27 +1,36 @@
-import requests
 import time
 from typing import Dict, List, Optional, Any
 from data_collectors.base_collector import BaseCollector
-from config import COURSE_NAME_TO_CHINESE, STUDENT_TO_CHINESE_NAME, STUDENT_TO_PREFERRED_ENGLISH_NAME, convert_score_to_grade
+from utils.term_resolver import resolve_term_ids
+from config import COURSE_NAME_TO_CHINESE, convert_score_to_grade
+from utils.student_identity import get_student_index
 
 class GradesCollector(BaseCollector):
     def get_enrolled_courses(self) -> List[Dict]:
-        """Get all courses the student is enrolled in"""
+        """Get all current-term courses the student is enrolled in"""
         url = "courses"
         params = {
             "enrollment_state": "active",
             "include": ["total_scores"]
         }
-        data = self._make_request(url, params)
+        term_ids = self.get_term_ids()
         
-        # Filter for courses with valid enrollments 
-        if data:
-            # Only include courses where the user is actually enrolled and has grades
-            return [
-                course for course in data 
-                if course.get("enrollments") and self.is_2025s_course(course.get("name", ""))
-            ]
-        return []
+        # Only include courses where the user is actually enrolled and has grades
+        return [
+            course for course in self._paginate(url, params)
+            if course.get("enrollments") and self.is_current_term_course(course, term_ids)
+        ]
+
+    def get_term_ids(self) -> Optional[List[int]]:
+        """Get the enrollment term ids to collect, or None if they could not be resolved"""
+        return resolve_term_ids(self.domain, self.headers)
+
+    def is_current_term_course(self, course: Dict, term_ids: Optional[List[int]]) -> bool:
+        """Check if a course belongs to one of the collected terms"""
+        if term_ids is None:
+            # Fall back to the course name when no term could be resolved
+            return self.is_2025s_course(course.get("name", ""))
+        return course.get("enrollment_term_id") in term_ids
 
     def is_2025s_course(self, course_name: str) -> bool:
         """Check if the course is from Spring 2025 (2025S)"""
@@ -29,28 +38,36 @@ class GradesCollector(BaseCollector):
 
     def collect(self) -> List[Dict[str, Any]]:
         """Collect grades data for all enrolled courses"""
-        grades_data = []
         timestamp = self.get_timestamp()
         
         # Get student name to match working example
         canvas_student_name = self.get_student_name()
         print(f"📢 Student: {canvas_student_name}")
         
+        # Get enrolled courses directly with grades
+        enrolled_courses = self.get_enrolled_courses()
+        
+        return self.build_grades_data(canvas_student_name, enrolled_courses, timestamp)
+
+    def build_grades_data(self, canvas_student_name: str, enrolled_courses: List[Dict],
+                          timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Build the grade records saved to grades.csv from courses with enrollment grades attached"""
+        grades_data = []
+        timestamp = timestamp or self.get_timestamp()
+        
         # Get the correct Chinese and English names
-        student_cn_name = STUDENT_TO_CHINESE_NAME.get(canvas_student_name, "")
-        student_en_name = STUDENT_TO_PREFERRED_ENGLISH_NAME.get(canvas_student_name, "")
+        student_index = get_student_index()
+        student_cn_name = student_index.chinese_name(canvas_student_name)
+        student_en_name = student_index.english_name(canvas_student_name)
         
         print(f"Student Chinese Name: {student_cn_name}")
         print(f"Student English Name: {student_en_name}")
         
-        # Get enrolled courses directly with grades
-        enrolled_courses = self.get_enrolled_courses()
-        
         if not enrolled_courses:
             print(f"⚠️ No active course enrollments found for {canvas_student_name}")
             return grades_data
             
-        print(f"Found {len(enrolled_courses)} active Spring 2025 course enrollments.")
+        print(f"Found {len(enrolled_courses)} active current-term course enrollments.")
         
         for course in enrolled_courses:
             course_name_en = course["name"]
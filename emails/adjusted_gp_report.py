@@ -18,6 +18,7 @@ if parent_dir not in sys.path:
 # Import the report generator
 from emails.report_generator import generate_email_html
 from emails.notifier.enhanced_email_notifier import EnhancedEmailNotifier
+from utils.grade_loader import load_notion_grades
 
 def send_report_email(report_path):
     """Send the adjusted report via email"""
@@ -80,7 +81,7 @@ def main():
     print(f"Reading original grades data from {original_grades_csv_path}")
     
     # Read the original data
-    df = pd.read_csv(original_grades_csv_path)
+    df = load_notion_grades(original_grades_csv_path)
     
     # Create a copy for the adjusted data
     adjusted_df = df.copy()
@@ -15,6 +15,15 @@ import numpy as np
 from typing import List, Dict, Any, Union, Tuple
 import argparse
 import logging
+import sys
+
+# Add the parent directory to the path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from utils.grade_loader import load_notion_grades
+from utils.student_identity import get_student_index
 
 # Configure logging
 logging.basicConfig(
@@ -71,6 +80,19 @@ def load_previous_data(cache_file: str) -> Dict:
         logger.warning(f"Could not load previous data: {e}")
         return {}
 
+def align_previous_students(previous_data: Dict, current_students) -> Dict:
+    """Rename students in previous data to this run's name for the same student (see utils/student_identity.py)"""
+    if not previous_data:
+        return previous_data
+    stored = set(previous_data.get('students', [])) | set(previous_data.get('student_scores', {}))
+    renamed = get_student_index().match_names(stored, current_students)
+    aligned = dict(previous_data)
+    if 'students' in previous_data:
+        aligned['students'] = [renamed[name] for name in previous_data['students']]
+    if 'student_scores' in previous_data:
+        aligned['student_scores'] = {renamed[name]: scores for name, scores in previous_data['student_scores'].items()}
+    return aligned
+
 def save_current_data(data: Dict, cache_file: str) -> None:
     """Save current data to cache file for future comparisons"""
     try:
@@ -94,7 +116,10 @@ def process_grades_data(grades_csv_path: str, previous_data: Dict) -> Tuple[Dict
     """
     try:
         # Read grades data
-        df = pd.read_csv(grades_csv_path)
+        df = load_notion_grades(grades_csv_path)
+        
+        # Earlier runs may have stored a student under another name form; match them up
+        previous_data = align_previous_students(previous_data, df["student_name"].unique())
         
         # Get timestamp
         timestamp = datetime.now().strftime("%B %d, %Y - %H:%M:%S")
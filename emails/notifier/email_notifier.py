@@ -15,7 +15,7 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 # Import the enhanced email notifier
-from emails.notifier.enhanced_email_notifier import EnhancedEmailNotifier
+from emails.notifier.enhanced_email_notifier import EnhancedEmailNotifier, format_notion_sync
 
 # Load environment variables from config/.env
 env_path = os.path.join(parent_dir, "config", ".env")
@@ -104,11 +104,13 @@ class EmailNotifier:
             print(f"Failed to send email: {str(e)}")
             return False
             
-    def send_success_notification(self, students_processed, records_added):
+    def send_success_notification(self, students_processed, records_added, timed_out_students=None, notion_sync=None):
         """Send a success notification with summary of the run and enhanced report."""
+        timed_out_students = timed_out_students or []
         try:
             # Try to send the enhanced report using our improved report generator
-            return self.enhanced_notifier.send_enhanced_report(students_processed, records_added)
+            return self.enhanced_notifier.send_enhanced_report(students_processed, records_added, timed_out_students,
+                                                               notion_sync)
         except Exception as e:
             print(f"Error sending enhanced report: {str(e)}. Falling back to simple notification.")
             
@@ -120,6 +122,8 @@ Canvas API Academic Data Collector completed successfully!
 Summary:
 - Students processed: {students_processed}
 - Records added to Notion: {records_added}
+- Notion pages: {format_notion_sync(notion_sync)}
+- Students timed out: {", ".join(timed_out_students) if timed_out_students else "None"}
 - Full logs available in: canvas_api.log
             """
             return self.send_notification(subject, message, is_success=True)
@@ -27,6 +27,13 @@ from emails.report_generator import generate_email_html
 env_path = os.path.join(parent_dir, "config", ".env")
 load_dotenv(env_path)
 
+def format_notion_sync(notion_sync):
+    """One line of Notion page counts ("Not synced" when the run did not reach Notion)."""
+    if not notion_sync:
+        return "Not synced"
+    return (f"{notion_sync.get('created', 0)} created, {notion_sync.get('updated', 0)} updated, "
+            f"{notion_sync.get('skipped', 0)} skipped, {notion_sync.get('failed', 0)} failed")
+
 class EnhancedEmailNotifier:
     def __init__(self):
         # Load email configuration from environment variables
@@ -91,8 +98,9 @@ class EnhancedEmailNotifier:
             print(f"Failed to send email: {str(e)}")
             return False
             
-    def send_enhanced_report(self, students_processed, records_added):
+    def send_enhanced_report(self, students_processed, records_added, timed_out_students=None, notion_sync=None):
         """Send an enhanced HTML report with detailed grade analysis."""
+        timed_out_students = timed_out_students or []
         try:
             # Define file paths
             current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -110,6 +118,12 @@ class EnhancedEmailNotifier:
             with open(output_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
             
+            # List students that missed the run deadline at the top of the report
+            if timed_out_students:
+                html_content = self._insert_timed_out_notice(html_content, timed_out_students)
+            if notion_sync:
+                html_content = self._insert_notion_sync_notice(html_content, notion_sync)
+            
             # Get the date for the subject line
             today = datetime.datetime.now().strftime("%Y-%m-%d")
             
@@ -120,9 +134,37 @@ class EnhancedEmailNotifier:
         except Exception as e:
             print(f"Error generating enhanced report: {str(e)}")
             # Fall back to simple success notification
-            return self.send_simple_success_notification(students_processed, records_added)
+            return self.send_simple_success_notification(students_processed, records_added, timed_out_students,
+                                                         notion_sync)
+    
+    def _insert_notion_sync_notice(self, html_content, notion_sync):
+        """Insert the Notion page counts of the run right after <body>."""
+        notice = f"""
+        <div style="background-color: #e7f3fe; color: #0c5460; padding: 15px; margin: 10px 0; border-radius: 5px;">
+            <strong>🔄 Notion sync:</strong> {format_notion_sync(notion_sync)}
+        </div>
+        """
+        body_start = html_content.find("<body")
+        if body_start == -1:
+            return notice + html_content
+        body_end = html_content.find(">", body_start) + 1
+        return html_content[:body_end] + notice + html_content[body_end:]
+    
+    def _insert_timed_out_notice(self, html_content, timed_out_students):
+        """Insert a notice listing students that missed the run deadline right after <body>."""
+        notice = f"""
+        <div style="background-color: #fff3cd; color: #856404; padding: 15px; margin: 10px 0; border-radius: 5px;">
+            <strong>⏱️ Timed out before the run deadline ({len(timed_out_students)}):</strong> {", ".join(timed_out_students)}
+        </div>
+        """
+        body_start = html_content.find("<body")
+        if body_start == -1:
+            return notice + html_content
+        body_end = html_content.find(">", body_start) + 1
+        return html_content[:body_end] + notice + html_content[body_end:]
     
-    def send_simple_success_notification(self, students_processed, records_added):
+    def send_simple_success_notification(self, students_processed, records_added, timed_out_students=None,
+                                         notion_sync=None):
         """Send a simple success notification with summary of the run."""
         subject = "Canvas Grades Collection Success"
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -142,6 +184,8 @@ class EnhancedEmailNotifier:
                     <ul>
                         <li><strong>Students processed:</strong> {students_processed}</li>
                         <li><strong>Records added to Notion:</strong> {records_added}</li>
+                        <li><strong>Notion pages:</strong> {format_notion_sync(notion_sync)}</li>
+                        <li><strong>Students timed out:</strong> {", ".join(timed_out_students) if timed_out_students else "None"}</li>
                         <li><strong>Full logs available in:</strong> logs/canvas_api.log</li>
                     </ul>
                 </div>
@@ -13,6 +13,15 @@ import re
 import base64
 from pathlib import Path
 import numpy as np
+import sys
+
+# Add the parent directory to the path
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from utils.grade_loader import load_notion_grades
+from utils.student_identity import get_student_index
 
 # Color codes for progress bars
 GREEN = "#4CAF50"  # >70% A grades
@@ -86,7 +95,7 @@ def generate_email_html(grades_csv_path: str, template_path: str, output_path: s
     logo_base64 = get_image_base64(logo_path)
     
     # Read grades data
-    df = pd.read_csv(grades_csv_path)
+    df = load_notion_grades(grades_csv_path)
     
     # Get timestamp
     timestamp = datetime.now().strftime("%B %d, %Y - %H:%M:%S")
@@ -96,8 +105,9 @@ def generate_email_html(grades_csv_path: str, template_path: str, output_path: s
     # Get batch ID from the data
     batch_id = df["Update Batch"].iloc[0] if "Update Batch" in df.columns else "Unknown"
     
-    # Count total students
-    students_processed = len(df["student_name"].unique())
+    # Count total students (name forms of the same student count once)
+    student_index = get_student_index()
+    students_processed = len({student_index.canonical_name(name) for name in df["student_name"].unique()})
     
     # Get all course columns (exclude non-course columns)
     non_course_columns = [
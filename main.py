@@ -1,12 +1,17 @@
 from utils.credential_manager import CredentialManager
-from data_collectors.grades import GradesCollector
-from utils.csv_handler import CSVHandler
+from data_collectors import get_grades_collector_class
+from utils.grade_partitions import create_grades_handler, grade_history_path
+from utils.grade_store import GradeStore
+from utils.grade_loader import load_notion_grades
+from utils.student_identity import get_student_index
 from notion_processor.notion_main import main as process_notion
 from emails.notifier.email_notifier import EmailNotifier
 import sys
 import os
 import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Add the config directory to the path
 config_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
@@ -14,7 +19,10 @@ if config_dir not in sys.path:
     sys.path.insert(0, config_dir)
 
 # Now import from config
-from config import GRADES_CSV_PATH, STUDENT_TO_CHINESE_NAME, STUDENT_TO_PREFERRED_ENGLISH_NAME
+from config import (
+    GRADES_DB_PATH, COLLECTION_MAX_WORKERS,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, RUN_DEADLINE_SECONDS, GRADES_COLLECTION_MODE
+)
 
 # Add the notion_processor directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "notion_processor"))
@@ -22,6 +30,10 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "not
 import logging
 from datetime import datetime
 from notion_processor.utils.batch_manager import initialize_batch
+from utils.rate_limiter import get_rate_limit_metrics
+from utils.http_client import set_run_deadline
+from utils.response_cache import get_response_cache
+from utils.error_handler import DeadlineExceededError
 
 # Configure logging
 logging.basicConfig(
@@ -44,7 +56,7 @@ def get_pages():
     payload = {"page_size": 100}  # Fixed parameter name
     
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = requests.post(url, json=payload, headers=headers, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
         response.raise_for_status()  # Raise exception for bad status codes
         data = response.json()
         print(json.dumps(data, indent=2))
@@ -68,6 +80,141 @@ def process_pages():
         except (KeyError, IndexError) as e:
             print(f"Error processing page: {e}")
 
+def collect_student_grades(manager, student_name):
+    """Collect grades for a single student. Returns None if the student was skipped."""
+    print(f"\n=== Processing student: {student_name} ===\n")
+    logging.info(f"Processing student: {student_name}")
+
+    # Get student credentials
+    credentials = manager.get_student_credentials(student_name)
+    if not credentials:
+        print(f"❌ No credentials found for {student_name}")
+        logging.warning(f"No credentials found for {student_name}")
+        return None
+
+    # Make sure user_id is an integer
+    user_id = credentials.get("user_id")
+    if not user_id:
+        print(f"❌ No user_id found for {student_name}")
+        logging.warning(f"No user_id found for {student_name}")
+        return None
+
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        print(f"❌ Invalid user_id for {student_name}: {user_id}")
+        logging.error(f"Invalid user_id for {student_name}: {user_id}")
+        return None
+
+    # Create grades collector for the configured collection mode
+    collector_class = get_grades_collector_class(GRADES_COLLECTION_MODE)
+    collector = collector_class(
+        student_name=student_name,
+        api_key=credentials["api_key"],
+        domain=credentials["domain"],
+        user_id=user_id
+    )
+
+    # Collect grades data
+    return collector.collect()
+
+def collect_all_students(manager, csv_handler, student_names, max_workers=COLLECTION_MAX_WORKERS,
+                         deadline_seconds=RUN_DEADLINE_SECONDS):
+    """
+    Collect grades for all students using a bounded worker pool.
+    Results are buffered in credentials order so the grade history matches a
+    serial run, and written once when collection ends.
+    Students still pending when the run deadline passes are cancelled.
+    Returns the number of students processed successfully and the timed-out student names.
+    """
+    students_processed = 0
+    timed_out_students = []
+    max_workers = max(1, min(max_workers, len(student_names)))
+
+    print(f"Collecting grades with {max_workers} worker(s)")
+    logging.info(f"Collecting grades with {max_workers} worker(s)")
+
+    # Requests in flight at the deadline are cut short by their capped timeouts
+    set_run_deadline(deadline_seconds)
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [
+            executor.submit(collect_student_grades, manager, student_name)
+            for student_name in student_names
+        ]
+
+        for student_name, future in zip(student_names, futures):
+            try:
+                timeout = max(0, deadline - time.monotonic()) if deadline else None
+                grades_data = future.result(timeout=timeout)
+
+                # Skipped students have already been reported
+                if grades_data is None:
+                    continue
+
+                # Buffer for the CSV commit at the end of the run
+                if grades_data:
+                    csv_handler.save_grades(grades_data)
+                    print(f"\n✅ Successfully collected grades for {student_name}")
+                    logging.info(f"Successfully collected grades for {student_name}")
+                    students_processed += 1
+                else:
+                    print(f"\n⚠️ No grades data collected for {student_name}")
+                    logging.warning(f"No grades data collected for {student_name}")
+
+            except (FuturesTimeoutError, DeadlineExceededError):
+                future.cancel()
+                timed_out_students.append(student_name)
+                print(f"⏱️ Run deadline reached before {student_name} finished")
+                logging.warning(f"Run deadline reached before {student_name} finished")
+
+            except Exception as e:
+                print(f"❌ Error processing {student_name}: {str(e)}")
+                logging.error(f"Error processing {student_name}: {str(e)}")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        set_run_deadline(None)
+        # Write everything collected in this run to the grade history at once
+        csv_handler.commit()
+
+    if timed_out_students:
+        print(f"⏱️ {len(timed_out_students)} student(s) timed out: {', '.join(timed_out_students)}")
+        logging.warning(f"Timed out students: {', '.join(timed_out_students)}")
+
+    return students_processed, timed_out_students
+
+def report_http_metrics():
+    """Print and log Canvas rate limit and response cache metrics for this run"""
+    metrics = get_rate_limit_metrics()
+    if metrics:
+        print("\n--- Canvas rate limit metrics ---")
+        for label, values in metrics.items():
+            summary = (
+                f"{label}: {values['requests']} requests, {values['throttled']} throttled, "
+                f"{values['remaining']} budget remaining, waited {values['total_wait']}s "
+                f"over {values['waits']} waits (max {values['max_wait']}s)"
+            )
+            print(summary)
+            logging.info(f"Rate limit metrics - {summary}")
+
+    cache = get_response_cache()
+    if cache:
+        stats = cache.stats()
+        summary = (
+            f"{stats['hits']} hits, {stats['revalidated']} revalidated (304), {stats['misses']} misses, "
+            f"hit ratio {stats['hit_ratio']:.1%}, miss ratio {stats['miss_ratio']:.1%}"
+        )
+        print(f"\n--- Canvas response cache: {summary} ---")
+        logging.info(f"Response cache metrics - {summary}")
+
+def count_notion_students(notion_grades_path):
+    """Count the rows of the one-row-per-student Notion grades view (0 when there is no file yet)"""
+    if not os.path.exists(notion_grades_path) or os.path.getsize(notion_grades_path) == 0:
+        return 0
+    return len(load_notion_grades(notion_grades_path))
+
 def collect_grades():
     """Collect grades for all students"""
     print("\n--- Starting grades collection ---\n")
@@ -76,9 +223,6 @@ def collect_grades():
     # Initialize credential manager
     manager = CredentialManager()
     
-    # Initialize CSV handler
-    csv_handler = CSVHandler(GRADES_CSV_PATH)
-    
     # Get all student names
     student_names = manager.get_all_student_names()
     
@@ -90,61 +234,21 @@ def collect_grades():
     print(f"Found {len(student_names)} students in credentials file.")
     logging.info(f"Found {len(student_names)} students in credentials file.")
     
-    # Process each student
-    for student_name in student_names:
-        print(f"\n=== Processing student: {student_name} ===\n")
-        logging.info(f"Processing student: {student_name}")
+    # Initialize CSV handler; the grade store stays open through the Notion step
+    grade_store = GradeStore(GRADES_DB_PATH, import_from=grade_history_path())
+    try:
+        csv_handler = create_grades_handler(grade_store=grade_store)
         
-        # Get student credentials
-        credentials = manager.get_student_credentials(student_name)
-        if not credentials:
-            print(f"❌ No credentials found for {student_name}")
-            logging.warning(f"No credentials found for {student_name}")
-            continue
-            
-        # Make sure user_id is an integer
-        user_id = credentials.get("user_id")
-        if not user_id:
-            print(f"❌ No user_id found for {student_name}")
-            logging.warning(f"No user_id found for {student_name}")
-            continue
-            
-        try:
-            user_id = int(user_id)
-        except ValueError:
-            print(f"❌ Invalid user_id for {student_name}: {user_id}")
-            logging.error(f"Invalid user_id for {student_name}: {user_id}")
-            continue
-            
-        # Create grades collector
-        collector = GradesCollector(
-            student_name=student_name,
-            api_key=credentials["api_key"],
-            domain=credentials["domain"],
-            user_id=user_id
-        )
+        # Process each student
+        collect_all_students(manager, csv_handler, student_names)
+        report_http_metrics()
         
-        try:
-            # Collect grades data
-            grades_data = collector.collect()
-            
-            # Save to CSV
-            if grades_data:
-                csv_handler.save_grades(grades_data)
-                print(f"\n✅ Successfully collected grades for {student_name}")
-                logging.info(f"Successfully collected grades for {student_name}")
-            else:
-                print(f"\n⚠️ No grades data collected for {student_name}")
-                logging.warning(f"No grades data collected for {student_name}")
-                
-        except Exception as e:
-            print(f"❌ Error processing {student_name}: {str(e)}")
-            logging.error(f"Error processing {student_name}: {str(e)}")
-    
-    # After all students are processed, generate the Notion-friendly CSV
-    print("\n--- Generating Notion-friendly grades format ---")
-    logging.info("Generating Notion-friendly grades format")
-    process_notion()
+        # After all students are processed, generate the Notion-friendly CSV
+        print("\n--- Generating Notion-friendly grades format ---")
+        logging.info("Generating Notion-friendly grades format")
+        process_notion()
+    finally:
+        grade_store.close()
     
     print("\n--- Grades collection completed ---")
     logging.info("Grades collection completed")
@@ -152,10 +256,10 @@ def collect_grades():
 def debug_student_mappings():
     """Print student name mappings for debugging"""
     print("\n--- Debugging Student Name Mappings ---")
-    for student_name in STUDENT_TO_CHINESE_NAME.keys():
-        chinese_name = STUDENT_TO_CHINESE_NAME.get(student_name, "")
-        english_name = STUDENT_TO_PREFERRED_ENGLISH_NAME.get(student_name, "")
-        print(f"Canvas name: {student_name} -> Chinese: {chinese_name}, English: {english_name}")
+    student_index = get_student_index()
+    for name_form, key in sorted(student_index.names.items()):
+        student = student_index.students[key]
+        print(f"Name: {name_form} -> Canvas: {student['student_name']}, Chinese: {student['chinese_name']}, English: {student['english_name']}")
     print("--- End of Student Name Mappings ---\n")
 
 def main():
@@ -187,10 +291,6 @@ def main():
         print("Creating credential manager...")
         manager = CredentialManager()
         
-        # Initialize CSV handler
-        print("Initializing CSV handler...")
-        csv_handler = CSVHandler(GRADES_CSV_PATH)
-        
         # Get all student names
         print("Getting student names...")
         student_names = manager.get_all_student_names()
@@ -204,93 +304,53 @@ def main():
         print(f"\nFound {len(student_names)} students in credentials file.\n")
         logging.info(f"Found {len(student_names)} students in credentials file.")
         
-        # Process each student
-        for student_name in student_names:
-            print(f"\n=== Processing student: {student_name} ===\n")
-            logging.info(f"Processing student: {student_name}")
+        # Initialize CSV handler; the grade store is closed before the email step
+        print("Initializing CSV handler...")
+        grade_store = GradeStore(GRADES_DB_PATH, import_from=grade_history_path())
+        try:
+            csv_handler = create_grades_handler(grade_store=grade_store)
             
-            # Get student credentials
-            credentials = manager.get_student_credentials(student_name)
-            if not credentials:
-                print(f"❌ No credentials found for {student_name}")
-                logging.warning(f"No credentials found for {student_name}")
-                continue
-                
-            # Make sure user_id is an integer
-            user_id = credentials.get("user_id")
-            if not user_id:
-                print(f"❌ No user_id found for {student_name}")
-                logging.warning(f"No user_id found for {student_name}")
-                continue
-                
-            try:
-                user_id = int(user_id)
-            except ValueError:
-                print(f"❌ Invalid user_id for {student_name}: {user_id}")
-                logging.error(f"Invalid user_id for {student_name}: {user_id}")
-                continue
-                
-            # Create grades collector
-            collector = GradesCollector(
-                student_name=student_name,
-                api_key=credentials["api_key"],
-                domain=credentials["domain"],
-                user_id=user_id
-            )
+            # Process each student
+            students_processed, timed_out_students = collect_all_students(manager, csv_handler, student_names)
+            report_http_metrics()
             
-            try:
-                # Collect grades data
-                grades_data = collector.collect()
-                
-                # Save to CSV
-                if grades_data:
-                    csv_handler.save_grades(grades_data)
-                    print(f"\n✅ Successfully collected grades for {student_name}")
-                    logging.info(f"Successfully collected grades for {student_name}")
-                    students_processed += 1
-                else:
-                    print(f"\n⚠️ No grades data collected for {student_name}")
-                    logging.warning(f"No grades data collected for {student_name}")
-                    
-            except Exception as e:
-                print(f"❌ Error processing {student_name}: {str(e)}")
-                logging.error(f"Error processing {student_name}: {str(e)}")
-        
-        # After all students are processed, generate the Notion-friendly CSV
-        print("\n--- Generating Notion-friendly grades format ---")
-        logging.info("Generating Notion-friendly grades format")
-        
-        # Track number of records before
-        before_count = 0
-        notion_grades_path = os.path.join("notion_processor", "data", "notion_grades.csv")
-        if os.path.exists(notion_grades_path):
-            with open(notion_grades_path, 'r') as f:
-                before_count = sum(1 for _ in f) - 1  # Subtract header
-        
-        process_notion()
-        
-        # Calculate records added
-        after_count = 0
-        if os.path.exists(notion_grades_path):
-            with open(notion_grades_path, 'r') as f:
-                after_count = sum(1 for _ in f) - 1  # Subtract header
-        
-        records_added = max(0, after_count - before_count)
+            # After all students are processed, generate the Notion-friendly CSV
+            print("\n--- Generating Notion-friendly grades format ---")
+            logging.info("Generating Notion-friendly grades format")
+            
+            # Track number of records before (students in the latest view, whatever the output mode)
+            notion_grades_path = os.path.join("notion_processor", "data", "notion_grades.csv")
+            before_count = count_notion_students(notion_grades_path)
+            
+            notion_sync = process_notion()
+            
+            # Calculate records added
+            after_count = count_notion_students(notion_grades_path)
+            
+            records_added = max(0, after_count - before_count)
+        finally:
+            grade_store.close()
         
         end_time = datetime.now()
         duration = end_time - start_time
         print(f"\n--- Grades collection completed at {end_time} ---")
         print(f"--- Duration: {duration} ---")
         print(f"--- Students processed: {students_processed} ---")
-        print(f"--- Records added: {records_added} ---\n")
+        print(f"--- Records added: {records_added} ---")
+        print(f"--- Notion pages: {notion_sync['created']} created, {notion_sync['updated']} updated, "
+              f"{notion_sync['skipped']} skipped, {notion_sync['failed']} failed ---")
+        print(f"--- Students timed out: {len(timed_out_students)} ---\n")
         
         logging.info(f"Grades collection completed at {end_time}")
         logging.info(f"Duration: {duration}")
         logging.info(f"Students processed: {students_processed}")
         logging.info(f"Records added: {records_added}")
+        logging.info(f"Notion pages: {notion_sync}")
+        logging.info(f"Students timed out: {len(timed_out_students)}")
         
         # Send success notification
-        email_notifier.send_success_notification(students_processed, records_added)
+        email_notifier.send_success_notification(students_processed, records_added, timed_out_students,
+                                                notion_sync)
         
     except Exception as e:
         error_message = f"An error occurred: {str(e)}"
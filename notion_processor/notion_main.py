@@ -16,13 +16,24 @@ if parent_dir not in sys.path:
 
 from notion_processor.utils.notion_formatter import NotionFormatter
 from notion_processor.utils.notion_api.client import NotionClient
+from utils.grade_partitions import ensure_partitions
+from utils.grade_store import GradeStore
+from config import GRADES_CSV_PATH, GRADES_DB_PATH, GRADES_HISTORY_LAYOUT, GRADES_PARTITION_DIR, NOTION_MIRROR_PATH
 
 def main():
-    """Main function to process grades data for Notion."""
+    """
+    Main function to process grades data for Notion.
+    Returns {"created", "updated", "skipped", "failed"} page counts of the Notion sync.
+    """
     print("\n--- Starting Notion data processing ---")
+    sync_summary = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
     
     # Define file paths
-    input_csv_path = os.path.join(parent_dir, "data", "grades.csv")
+    if GRADES_HISTORY_LAYOUT == "partitioned":
+        input_csv_path = os.path.join(parent_dir, GRADES_PARTITION_DIR)
+        ensure_partitions(input_csv_path, os.path.join(parent_dir, GRADES_CSV_PATH))
+    else:
+        input_csv_path = os.path.join(parent_dir, "data", "grades.csv")
     output_csv_path = os.path.join(current_dir, "data", "notion_grades.csv")
     
     # Ensure output directory exists
@@ -30,19 +41,34 @@ def main():
     
     # Transform grades data to Notion format
     print("Transforming grades data to Notion format...")
-    formatter = NotionFormatter(input_csv_path, output_csv_path)
-    formatter.transform_long_to_wide()
+    grade_store = GradeStore(os.path.join(parent_dir, GRADES_DB_PATH), import_from=input_csv_path)
+    try:
+        formatter = NotionFormatter(input_csv_path, output_csv_path, grade_store=grade_store)
+        formatter.transform_long_to_wide()
+    finally:
+        grade_store.close()
     
     # Upload to Notion
     try:
         print("Appending data to Notion database...")
-        notion_client = NotionClient()
-        affected_count = notion_client.update_student_records(output_csv_path)
-        print(f"✅ Successfully appended {affected_count} records to Notion database")
+        notion_client = NotionClient(os.path.join(parent_dir, NOTION_MIRROR_PATH) if NOTION_MIRROR_PATH else None)
+        try:
+            affected_count = notion_client.update_student_records(output_csv_path)
+        finally:
+            notion_client.close()
+        print(f"✅ Successfully wrote {affected_count} records to Notion database")
+        if notion_client.last_sync_summary is not None:
+            sync_summary = notion_client.last_sync_summary
+        upload_result = notion_client.last_upload_result
+        if upload_result is not None:
+            for failure in upload_result.failed:
+                print(f"⚠️ Failed to write {failure['student_name']} (status {failure['status']}, "
+                      f"{failure['attempts']} attempts): {failure['error']}")
     except Exception as e:
         print(f"⚠️ Error uploading to Notion: {str(e)}")
     
     print("--- Notion data processing completed ---\n")
+    return sync_summary
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
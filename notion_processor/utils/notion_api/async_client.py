@@ -0,0 +1,312 @@
+"""
+Concurrent Notion requests on top of notion_client.AsyncClient
+Keeps at most NOTION_MAX_CONCURRENCY requests in flight, optionally paces request starts
+to NOTION_REQUESTS_PER_SECOND, and pauses every request when Notion answers 429 until
+its Retry-After has passed. Per-page outcomes are collected in an UploadResult. Database
+queries are streamed page by page.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from config import NOTION_MAX_CONCURRENCY, NOTION_MAX_RETRIES, NOTION_REQUESTS_PER_SECOND
+from utils.error_handler import logger
+
+# Statuses worth another attempt besides 429
+RETRY_STATUSES = {409, 500, 502, 503, 504}
+# Wait used when a 429 comes without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+# Pages per database query response (Notion's maximum)
+QUERY_PAGE_SIZE = 100
+# Query passes when resetting flags (later passes retry pages whose update failed)
+RESET_MAX_PASSES = 3
+
+LATEST_BATCH_FILTER = {"property": "Is Latest Batch", "select": {"equals": "True"}}
+RESET_PROPERTIES = {"Is Latest Batch": {"select": {"name": "False"}}}
+
+class RateLimitGate:
+    """Paces request starts for every task and holds them all while Notion is rate limiting"""
+
+    def __init__(self, requests_per_second: float = NOTION_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+        # Metrics
+        self.pauses = 0
+        self.total_pause = 0.0
+
+    async def wait(self) -> None:
+        """Wait for this task's start slot"""
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start, self._paused_until)
+            self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for seconds (a 429 applies to the whole integration, not one page)"""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self.pauses += 1
+            self.total_pause += seconds
+            self._paused_until = until
+
+class UploadResult:
+    """Outcome of a batch of page requests"""
+
+    def __init__(self, action: str):
+        self.action = action
+        # {"student_name", "page_id"} per page that succeeded
+        self.succeeded: List[Dict[str, Any]] = []
+        # {"student_name", "page_id", "status", "code", "error", "attempts"} per page that failed
+        self.failed: List[Dict[str, Any]] = []
+        self.rate_limit_pauses = 0
+        self.duration = 0.0
+
+    @property
+    def succeeded_count(self) -> int:
+        return len(self.succeeded)
+
+    @property
+    def failed_count(self) -> int:
+        return len(self.failed)
+
+    def summary(self) -> str:
+        """One line summary for logs and console output"""
+        return (f"{self.action}: {self.succeeded_count} succeeded, {self.failed_count} failed "
+                f"in {self.duration:.1f}s ({self.rate_limit_pauses} rate limit pauses)")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict for JSON reports and email summaries"""
+        return {
+            "action": self.action,
+            "succeeded": self.succeeded_count,
+            "failed": self.failed,
+            "rate_limit_pauses": self.rate_limit_pauses,
+            "duration": round(self.duration, 2)
+        }
+
+def _retry_after(error: HTTPResponseError) -> float:
+    """Seconds Notion asked us to wait (Retry-After is given in seconds)"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+def _page_title(page: Dict) -> Optional[str]:
+    """Get the plain text of a page's title property (the student name)"""
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return "".join(part.get("plain_text", "") for part in prop.get("title", [])) or None
+    return None
+
+class AsyncNotionRunner:
+    """Runs many Notion requests concurrently under one rate limit gate"""
+
+    def __init__(self, api_key: str, max_concurrency: int = NOTION_MAX_CONCURRENCY,
+                 max_retries: int = NOTION_MAX_RETRIES, requests_per_second: float = NOTION_REQUESTS_PER_SECOND):
+        self.api_key = api_key
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.requests_per_second = requests_per_second
+
+    async def _call(self, gate: RateLimitGate, request: Callable[[], Awaitable[Dict]], idempotent: bool = True) -> Dict:
+        """
+        Send one request, retrying 429s (after the shared pause), conflicts, 5xx and timeouts.
+        Non-idempotent requests (page creates) are retried only on 429: after a conflict,
+        5xx or timeout Notion may already have saved the page, and a resend would duplicate it.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            await gate.wait()
+            try:
+                return await request()
+            except HTTPResponseError as e:
+                if attempt > self.max_retries:
+                    raise
+                if e.status == 429:
+                    delay = _retry_after(e)
+                    gate.pause(delay)
+                    logger.warning(f"Notion rate limited, pausing all requests for {delay:.1f}s")
+                    continue
+                if e.status not in RETRY_STATUSES or not idempotent:
+                    raise
+            except RequestTimeoutError:
+                if attempt > self.max_retries or not idempotent:
+                    raise
+            await asyncio.sleep(random.uniform(0, min(30.0, 0.5 * (2 ** attempt))))
+
+    async def _process(self, result: UploadResult, client: AsyncClient, gate: RateLimitGate,
+                       jobs: Union[Iterable, AsyncIterable],
+                       make_request: Callable[[AsyncClient, Optional[str], Any], Awaitable[Dict]]) -> int:
+        """
+        Run make_request(client, page_id, payload) for every (student_name, page_id, payload)
+        job; returns the job count. Jobs with page_id None are creates and are not retried
+        after errors that may have left the page saved.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = []
+
+        async def run_job(student_name: Optional[str], page_id: Optional[str], payload: Any) -> None:
+            attempts = 0
+
+            def request() -> Awaitable[Dict]:
+                nonlocal attempts
+                attempts += 1
+                return make_request(client, page_id, payload)
+
+            try:
+                # A job without a page id creates one, which must not be resent blindly
+                response = await self._call(gate, request, idempotent=page_id is not None)
+                result.succeeded.append({"student_name": student_name, "page_id": response.get("id", page_id)})
+            except Exception as e:
+                code = getattr(e, "code", None)
+                result.failed.append({
+                    "student_name": student_name,
+                    "page_id": page_id,
+                    "status": getattr(e, "status", None),
+                    "code": getattr(code, "value", code),
+                    "error": str(e),
+                    "attempts": attempts
+                })
+            finally:
+                semaphore.release()
+
+        async def iterate():
+            if hasattr(jobs, "__aiter__"):
+                async for job in jobs:
+                    yield job
+            else:
+                for job in jobs:
+                    yield job
+
+        # A slot is taken before each job starts, so a streamed query is read only as fast as jobs finish
+        async for job in iterate():
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run_job(*job)))
+        await asyncio.gather(*tasks)
+        return len(tasks)
+
+    async def run(self, action: str, jobs: Union[Iterable, AsyncIterable],
+                  make_request: Callable[[AsyncClient, Optional[str], Any], Awaitable[Dict]]) -> UploadResult:
+        """Run make_request(client, page_id, payload) for every (student_name, page_id, payload) job"""
+        result = UploadResult(action)
+        gate = RateLimitGate(self.requests_per_second)
+        started = time.monotonic()
+        client = AsyncClient(auth=self.api_key)
+        try:
+            await self._process(result, client, gate, jobs, make_request)
+        finally:
+            await client.aclose()
+
+        result.rate_limit_pauses = gate.pauses
+        result.duration = time.monotonic() - started
+        logger.info(result.summary())
+        return result
+
+    async def iter_query(self, client: AsyncClient, gate: RateLimitGate, database_id: str, body: Dict,
+                         filter_properties: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every page a database query matches, following next_cursor page by page"""
+        # filter_properties is a query string parameter, so it goes through client.request
+        query = {"filter_properties": filter_properties} if filter_properties else None
+        cursor = None
+        while True:
+            page_body = dict(body, page_size=QUERY_PAGE_SIZE)
+            if cursor:
+                page_body["start_cursor"] = cursor
+            response = await self._call(gate, lambda: client.request(
+                path=f"databases/{database_id}/query", method="POST", query=query, body=page_body
+            ))
+            for page in response.get("results", []):
+                yield page
+            cursor = response.get("next_cursor")
+            if not response.get("has_more") or not cursor:
+                return
+
+    def query_pages(self, database_id: str, body: Dict, filter_properties: Optional[List[str]] = None) -> List[Dict]:
+        """Get every page a database query matches (see iter_query)"""
+        async def collect() -> List[Dict]:
+            gate = RateLimitGate(self.requests_per_second)
+            client = AsyncClient(auth=self.api_key)
+            try:
+                return [page async for page in self.iter_query(client, gate, database_id, body, filter_properties)]
+            finally:
+                await client.aclose()
+        return asyncio.run(collect())
+
+    def create_pages(self, database_id: str, pages: Iterable[Tuple[str, Dict[str, Dict]]]) -> UploadResult:
+        """Create one page per (student_name, properties) in the database"""
+        async def create(client: AsyncClient, page_id: Optional[str], properties: Dict) -> Dict:
+            return await client.pages.create(parent={"database_id": database_id}, properties=properties)
+        jobs = [(student_name, None, properties) for student_name, properties in pages]
+        return asyncio.run(self.run("Create pages", jobs, create))
+
+    def write_pages(self, database_id: str, jobs: Iterable[Tuple[str, Optional[str], Dict[str, Dict]]],
+                    action: str = "Sync pages") -> UploadResult:
+        """Create (page_id None) or update one page per (student_name, page_id, properties)"""
+        async def write(client: AsyncClient, page_id: Optional[str], properties: Dict) -> Dict:
+            if page_id is None:
+                return await client.pages.create(parent={"database_id": database_id}, properties=properties)
+            return await client.pages.update(page_id=page_id, properties=properties)
+        return asyncio.run(self.run(action, list(jobs), write))
+
+    def reset_latest_batch_flags(self, database_id: str, max_passes: int = RESET_MAX_PASSES) -> UploadResult:
+        """
+        Set Is Latest Batch to "False" on every page where it is "True". Each pass reads the
+        whole filtered query before updating (updated pages leave the filter, which would
+        shift the cursor), then updates the pages concurrently. Pages whose update failed
+        are still flagged, so the next pass finds and retries them. Pages still flagged
+        after max_passes are left in result.failed and logged.
+        """
+        async def update(client: AsyncClient, page_id: Optional[str], properties: Dict) -> Dict:
+            return await client.pages.update(page_id=page_id, properties=properties)
+
+        async def reset() -> UploadResult:
+            result = UploadResult("Reset latest batch flags")
+            gate = RateLimitGate(self.requests_per_second)
+            started = time.monotonic()
+            client = AsyncClient(auth=self.api_key)
+            reset_ids = set()
+
+            try:
+                for query_pass in range(max(1, max_passes)):
+                    jobs = [
+                        (_page_title(page), page["id"], RESET_PROPERTIES)
+                        async for page in self.iter_query(client, gate, database_id, {"filter": LATEST_BATCH_FILTER},
+                                                          filter_properties=["title"])
+                        if page["id"] not in reset_ids
+                    ]
+                    if not jobs:
+                        result.failed = []
+                        break
+                    if query_pass:
+                        logger.info(f"Reset pass {query_pass + 1}: retrying {len(jobs)} pages still flagged")
+
+                    pass_result = UploadResult(result.action)
+                    await self._process(pass_result, client, gate, jobs, update)
+                    result.succeeded.extend(pass_result.succeeded)
+                    reset_ids.update(entry["page_id"] for entry in pass_result.succeeded)
+                    result.failed = pass_result.failed
+                    if not result.failed:
+                        break
+            finally:
+                await client.aclose()
+
+            if result.failed:
+                logger.warning(f"{result.failed_count} pages still flagged as the latest batch after "
+                               f"{max(1, max_passes)} reset passes: "
+                               f"{', '.join(entry['page_id'] for entry in result.failed)}")
+            result.rate_limit_pauses = gate.pauses
+            result.duration = time.monotonic() - started
+            logger.info(result.summary())
+            return result
+
+        return asyncio.run(reset())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Latest batch pointer for the Notion grades database
+Instead of flipping "Is Latest Batch" on every page of the previous run, each run stamps
+its new pages with an Upload Batch id and a relation to one control page, then writes
+its batch id to that control page. The "Is Current Batch" formula compares the two, so
+dashboards filtering on it follow the pointer and a run costs one extra write.
+
+The migrate command sets this up on an existing database: it creates the control page
+(in a one-row database under --parent-page) unless one is given, adds the Batch Control,
+Upload Batch and Is Current Batch properties, and links the pages currently flagged as
+the latest batch. The Is Latest Batch property is left in place.
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Add the repository root to the path so the module can run as a script
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import NOTION_BATCH_CONTROL_PAGE_ID
+from notion_processor.utils.notion_api.async_client import AsyncNotionRunner, LATEST_BATCH_FILTER
+from notion_processor.utils.notion_api.mirror import plain_value
+from utils.error_handler import logger
+
+# Grades database properties used in pointer mode
+CONTROL_RELATION_PROPERTY = "Batch Control"
+UPLOAD_BATCH_PROPERTY = "Upload Batch"
+CURRENT_BATCH_PROPERTY = "Is Current Batch"
+# Control database properties
+CONTROL_TITLE_PROPERTY = "Name"
+CONTROL_BATCH_PROPERTY = "Latest Batch"
+
+IS_CURRENT_BATCH_FORMULA = (
+    f'prop("{CONTROL_RELATION_PROPERTY}").first().prop("{CONTROL_BATCH_PROPERTY}") == prop("{UPLOAD_BATCH_PROPERTY}")'
+)
+
+def _rich_text(value: str) -> Dict:
+    return {"rich_text": [{"text": {"content": value}}]}
+
+class LatestBatchPointer:
+    """The control page holding the latest batch id"""
+
+    def __init__(self, client, control_page_id: str):
+        self.client = client
+        self.control_page_id = control_page_id
+
+    def page_properties(self, batch_id: str) -> Dict[str, Dict]:
+        """Properties that put a new grades page in batch_id"""
+        return {
+            CONTROL_RELATION_PROPERTY: {"relation": [{"id": self.control_page_id}]},
+            UPLOAD_BATCH_PROPERTY: _rich_text(batch_id)
+        }
+
+    def read(self) -> Optional[str]:
+        """Get the batch id the control page points to"""
+        page = self.client.pages.retrieve(page_id=self.control_page_id)
+        parts = page["properties"].get(CONTROL_BATCH_PROPERTY, {}).get("rich_text", [])
+        return "".join(part.get("plain_text", "") for part in parts) or None
+
+    def write(self, batch_id: str) -> None:
+        """Point the control page at batch_id"""
+        self.client.pages.update(page_id=self.control_page_id, properties={CONTROL_BATCH_PROPERTY: _rich_text(batch_id)})
+        logger.info(f"Latest batch pointer moved to {batch_id}")
+
+def create_control_page(client, parent_page_id: str) -> str:
+    """Create the one-row batch control database under parent_page_id; returns the control page id"""
+    database = client.databases.create(
+        parent={"type": "page_id", "page_id": parent_page_id},
+        title=[{"type": "text", "text": {"content": "Grades Batch Control"}}],
+        properties={CONTROL_TITLE_PROPERTY: {"title": {}}, CONTROL_BATCH_PROPERTY: {"rich_text": {}}}
+    )
+    page = client.pages.create(
+        parent={"database_id": database["id"]},
+        properties={CONTROL_TITLE_PROPERTY: {"title": [{"text": {"content": "Latest batch"}}]}}
+    )
+    return page["id"]
+
+def _latest_batch_pages(runner: AsyncNotionRunner, database_id: str) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """(page_id, student_name, Update Batch) of every page flagged as the latest batch"""
+    pages = runner.query_pages(database_id, {"filter": LATEST_BATCH_FILTER}, filter_properties=["title", "Update Batch"])
+    return [
+        (page["id"],
+         plain_value(page["properties"].get("student_name", {})) or None,
+         plain_value(page["properties"].get("Update Batch", {})) or None)
+        for page in pages
+    ]
+
+def migrate(client, api_key: str, database_id: str, parent_page_id: Optional[str] = None,
+            control_page_id: Optional[str] = None) -> str:
+    """Move the database to pointer mode; returns the control page id"""
+    if not control_page_id:
+        if not parent_page_id:
+            raise ValueError("Pass --parent-page to create the control page, or --control-page to reuse one")
+        control_page_id = create_control_page(client, parent_page_id)
+        print(f"✅ Created control page {control_page_id}")
+
+    control_page = client.pages.retrieve(page_id=control_page_id)
+    control_database_id = control_page["parent"]["database_id"]
+
+    # The relation first: the formula reads through it
+    client.databases.update(database_id=database_id, properties={
+        CONTROL_RELATION_PROPERTY: {"relation": {"database_id": control_database_id, "single_property": {}}},
+        UPLOAD_BATCH_PROPERTY: {"rich_text": {}}
+    })
+    client.databases.update(database_id=database_id, properties={
+        CURRENT_BATCH_PROPERTY: {"formula": {"expression": IS_CURRENT_BATCH_FORMULA}}
+    })
+    print(f"✅ Added {CONTROL_RELATION_PROPERTY}, {UPLOAD_BATCH_PROPERTY} and {CURRENT_BATCH_PROPERTY} properties")
+
+    # Only the current latest batch needs linking: unlinked pages are never current
+    runner = AsyncNotionRunner(api_key)
+    pages = _latest_batch_pages(runner, database_id)
+    batches = [batch for _, _, batch in pages if batch]
+    batch_id = max(set(batches), key=batches.count) if batches else "migrated"
+    pointer = LatestBatchPointer(client, control_page_id)
+    jobs = [(student_name, page_id, pointer.page_properties(batch_id)) for page_id, student_name, _ in pages]
+
+    result = runner.write_pages(database_id, jobs, action="Link latest batch pages")
+    print(f"{'✅' if not result.failed else '⚠️'} {result.summary()}")
+    for failure in result.failed:
+        print(f"⚠️ Failed to link {failure['student_name']} ({failure['page_id']}): {failure['error']}")
+
+    pointer.write(batch_id)
+    print(f"✅ Latest batch pointer set to {batch_id}")
+    print(f"Set NOTION_LATEST_BATCH_MODE=pointer and NOTION_BATCH_CONTROL_PAGE_ID={control_page_id}, "
+          f"then filter dashboards on '{CURRENT_BATCH_PROPERTY}' instead of 'Is Latest Batch'")
+    return control_page_id
+
+def main():
+    """Command line entry point for migrating to and inspecting the latest batch pointer"""
+    from notion_client import Client
+    from notion_processor.utils.notion_api.config import NOTION_API_KEY, NOTION_DATABASE_ID
+
+    parser = argparse.ArgumentParser(description="Manage the latest batch pointer of the Notion grades database")
+    parser.add_argument("--control-page", default=NOTION_BATCH_CONTROL_PAGE_ID, help="Control page id")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Set up pointer mode on the grades database")
+    migrate_parser.add_argument("--parent-page", help="Page to create the control database under")
+    subparsers.add_parser("show", help="Print the batch the control page points to")
+    set_parser = subparsers.add_parser("set", help="Point the control page at a batch")
+    set_parser.add_argument("batch_id", help="Batch id, e.g. 250401-1200")
+
+    args = parser.parse_args()
+    client = Client(auth=NOTION_API_KEY)
+    try:
+        if args.command == "migrate":
+            migrate(client, NOTION_API_KEY, NOTION_DATABASE_ID, args.parent_page, args.control_page)
+            return 0
+        if not args.control_page:
+            print("⚠️ No control page configured (NOTION_BATCH_CONTROL_PAGE_ID or --control-page)")
+            return 1
+        pointer = LatestBatchPointer(client, args.control_page)
+        if args.command == "show":
+            print(pointer.read() or "(no batch)")
+        elif args.command == "set":
+            pointer.write(args.batch_id)
+            print(f"✅ Latest batch pointer set to {args.batch_id}")
+    except Exception as e:
+        print(f"⚠️ Error: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
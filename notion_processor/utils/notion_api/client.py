@@ -5,6 +5,15 @@ import numpy as np
 from datetime import datetime
 from notion_client import Client
 from typing import Dict, Any, List, Optional
+from utils.grade_loader import load_notion_grades
+from utils.error_handler import logger
+from config import (
+    NOTION_BATCH_CONTROL_PAGE_ID, NOTION_LATEST_BATCH_MODE, NOTION_MIRROR_PATH, NOTION_SYNC_MODE, NOTION_UPLOAD_MODE
+)
+from notion_processor.utils.batch_manager import get_current_batch
+from .async_client import AsyncNotionRunner, LATEST_BATCH_FILTER, QUERY_PAGE_SIZE, RESET_PROPERTIES
+from .batch_pointer import LatestBatchPointer
+from .mirror import NotionMirror, plain_value
 
 # Import configuration
 from .config import (
@@ -14,11 +23,35 @@ from .config import (
     NOTION_PROPERTY_TYPES
 )
 
+# Properties that change every batch without the grades changing; diff sync writes them
+# with each change but never because of them
+DIFF_EXCLUDED_PROPERTIES = {"Update Batch", "Is Latest Batch"}
+
 class NotionClient:
-    def __init__(self):
-        """Initialize the Notion client with API key."""
+    def __init__(self, mirror_path: Optional[str] = NOTION_MIRROR_PATH):
+        """Initialize the Notion client with API key (and the local database mirror unless mirror_path is empty)."""
         self.client = Client(auth=NOTION_API_KEY)
         self.database_id = NOTION_DATABASE_ID
+        self.mirror = NotionMirror(mirror_path, self.database_id) if mirror_path else None
+        # The mirror is refreshed once per client, on first use
+        self._mirror_refreshed = False
+        # Control page holding the latest batch id (pointer mode) instead of per-page flags
+        self.batch_pointer = None
+        if NOTION_LATEST_BATCH_MODE == "pointer":
+            if NOTION_SYNC_MODE == "diff":
+                # Diff sync edits one page per student in place and never moves the pointer
+                print("⚠️ NOTION_LATEST_BATCH_MODE=pointer has no effect with NOTION_SYNC_MODE=diff")
+                logger.warning("NOTION_LATEST_BATCH_MODE=pointer is ignored in diff sync mode")
+            elif NOTION_BATCH_CONTROL_PAGE_ID:
+                self.batch_pointer = LatestBatchPointer(self.client, NOTION_BATCH_CONTROL_PAGE_ID)
+            else:
+                print("⚠️ NOTION_LATEST_BATCH_MODE is pointer but NOTION_BATCH_CONTROL_PAGE_ID is empty; using flags")
+        # UploadResult of the last concurrent upload (async upload mode)
+        self.last_upload_result = None
+        # UploadResult of the last concurrent flag reset (async upload mode)
+        self.last_reset_result = None
+        # {"created", "updated", "skipped", "failed"} of the last update_student_records call
+        self.last_sync_summary = None
         
     def _format_property_value(self, property_name: str, value: Any) -> Dict[str, Any]:
         """Format a property value according to its type in Notion."""
@@ -128,8 +161,30 @@ class NotionClient:
         
         return properties
         
+    def close(self) -> None:
+        """Close the local database mirror."""
+        if self.mirror is not None:
+            self.mirror.close()
+    
+    def _refresh_mirror(self) -> bool:
+        """Refresh the mirror with pages edited since its last refresh; returns whether it can be used."""
+        if self.mirror is None:
+            return False
+        if not self._mirror_refreshed:
+            try:
+                fetched = self.mirror.refresh(self.client)
+                print(f"🔄 Notion mirror refreshed: {fetched} pages edited since the last run")
+                self._mirror_refreshed = True
+            except Exception as e:
+                print(f"⚠️ Error refreshing Notion mirror, querying Notion directly: {str(e)}")
+                return False
+        return True
+    
     def get_existing_student_names(self) -> List[str]:
         """Get a list of student names already in the Notion database."""
+        if self._refresh_mirror():
+            return self.mirror.student_names()
+        
         results = []
         has_more = True
         next_cursor = None
@@ -159,36 +214,55 @@ class NotionClient:
         
         return results
     
+    def iter_latest_batch_page_ids(self):
+        """Yield the id of every page where 'Is Latest Batch' is "True", following the query cursor"""
+        next_cursor = None
+        while True:
+            body = {"filter": LATEST_BATCH_FILTER, "page_size": QUERY_PAGE_SIZE}
+            if next_cursor:
+                body["start_cursor"] = next_cursor
+            # filter_properties limits each page to its title, so only ids (and names) are downloaded
+            response = self.client.request(
+                path=f"databases/{self.database_id}/query",
+                method="POST",
+                query={"filter_properties": ["title"]},
+                body=body
+            )
+            for page in response["results"]:
+                yield page["id"]
+            
+            next_cursor = response.get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
+                return
+    
     def reset_latest_batch_flags(self) -> int:
         """
         Reset all 'Is Latest Batch' flags to False for existing records.
         Returns the number of records updated.
         """
         print("Resetting 'Is Latest Batch' flags for existing records...")
-        updated_count = 0
         
         try:
-            # Query records where Is Latest Batch is "True"
-            response = self.client.databases.query(
-                database_id=self.database_id,
-                filter={
-                    "property": "Is Latest Batch",
-                    "select": {
-                        "equals": "True"
-                    }
-                }
-            )
+            if self._refresh_mirror():
+                return self._reset_mirrored_flags()
+            
+            if NOTION_UPLOAD_MODE == "async":
+                # Every flagged page is collected first, then updated concurrently; failures are retried
+                result = AsyncNotionRunner(NOTION_API_KEY).reset_latest_batch_flags(self.database_id)
+                self.last_reset_result = result
+                print(f"{'✅' if not result.failed else '⚠️'} {result.summary()}")
+                for failure in result.failed:
+                    print(f"⚠️ Still flagged as the latest batch: {failure['student_name']} ({failure['page_id']}): {failure['error']}")
+                return result.succeeded_count
+            
+            # Collect every id before updating: updated pages leave the filter, which would shift the cursor
+            page_ids = list(self.iter_latest_batch_page_ids())
+            updated_count = 0
             
             # Update each record
-            for page in response["results"]:
-                page_id = page["id"]
+            for page_id in page_ids:
                 try:
-                    self.client.pages.update(
-                        page_id=page_id,
-                        properties={
-                            "Is Latest Batch": {"select": {"name": "False"}}
-                        }
-                    )
+                    self.client.pages.update(page_id=page_id, properties=RESET_PROPERTIES)
                     updated_count += 1
                 except Exception as e:
                     print(f"⚠️ Error updating record {page_id}: {str(e)}")
@@ -201,6 +275,35 @@ class NotionClient:
             print(f"⚠️ Error resetting 'Is Latest Batch' flags: {str(e)}")
             return 0
     
+    def _reset_mirrored_flags(self) -> int:
+        """Reset the flags of the latest batch pages known to the mirror, recording each change in it."""
+        jobs = [(student_name, page_id, RESET_PROPERTIES) for page_id, student_name in self.mirror.latest_batch_pages()]
+        
+        if NOTION_UPLOAD_MODE == "async":
+            result = AsyncNotionRunner(NOTION_API_KEY).write_pages(self.database_id, jobs,
+                                                                   action="Reset latest batch flags")
+            self.last_reset_result = result
+            reset_ids = [entry["page_id"] for entry in result.succeeded]
+            missing_ids = [entry["page_id"] for entry in result.failed if entry["status"] == 404]
+            print(f"{'✅' if not result.failed else '⚠️'} {result.summary()}")
+        else:
+            reset_ids = []
+            missing_ids = []
+            for _, page_id, properties in jobs:
+                try:
+                    self.client.pages.update(page_id=page_id, properties=properties)
+                    reset_ids.append(page_id)
+                except Exception as e:
+                    print(f"⚠️ Error updating record {page_id}: {str(e)}")
+                    if getattr(e, "status", None) == 404:
+                        missing_ids.append(page_id)
+            print(f"✅ Reset {len(reset_ids)} 'Is Latest Batch' flags")
+        
+        self.mirror.set_latest_flags(reset_ids, False)
+        # Pages deleted in Notion since they were mirrored
+        self.mirror.remove(missing_ids)
+        return len(reset_ids)
+    
     def append_data_from_csv(self, csv_path: str) -> int:
         """
         Append data from a CSV file to the Notion database.
@@ -212,7 +315,7 @@ class NotionClient:
             
         try:
             # Read the CSV file
-            df = pd.read_csv(csv_path)
+            df = load_notion_grades(csv_path)
             
             if df.empty:
                 print(f"⚠️ No data found in {csv_path}")
@@ -245,6 +348,14 @@ class NotionClient:
             print(f"⚠️ Error processing CSV: {str(e)}")
             return 0
             
+    def _move_batch_pointer(self, batch_id: str) -> None:
+        """Point the control page at this run's batch (one write instead of resetting every flag)."""
+        try:
+            self.batch_pointer.write(batch_id)
+            print(f"✅ Latest batch pointer moved to {batch_id}")
+        except Exception as e:
+            print(f"⚠️ Error moving latest batch pointer to {batch_id}: {str(e)}")
+    
     def update_student_records(self, csv_path: str) -> int:
         """
         Append all student records from a CSV file to the Notion database.
@@ -254,28 +365,36 @@ class NotionClient:
         if not os.path.exists(csv_path):
             print(f"⚠️ CSV file {csv_path} does not exist.")
             return 0
+        
+        if NOTION_SYNC_MODE == "diff":
+            return self.sync_student_records(csv_path)
             
         try:
-            # First, reset all 'Is Latest Batch' flags
-            self.reset_latest_batch_flags()
+            if self.batch_pointer is None:
+                # First, reset all 'Is Latest Batch' flags
+                self.reset_latest_batch_flags()
             
-            # Read the CSV file - handle N/A by converting them to NaN
-            df = pd.read_csv(csv_path, na_values=['N/A', ''])
+            # Read the CSV file - N/A and empty cells are loaded as NaN
+            df = load_notion_grades(csv_path)
             
             # Replace NaN with None to avoid JSON serialization issues
-            df = df.replace({np.nan: None})
+            df = df.astype(object).where(df.notna(), None)
             
-            # Set 'Is Latest Batch' to True for all new records
-            df['Is Latest Batch'] = True
+            if self.batch_pointer is None:
+                # Set 'Is Latest Batch' to True for all new records
+                df['Is Latest Batch'] = True
+            else:
+                # The new pages join this run's batch; the control page is moved once they exist
+                df = df.drop(columns=['Is Latest Batch'], errors='ignore')
+                batch_id = get_current_batch()
+                batch_properties = self.batch_pointer.page_properties(batch_id)
             
             if df.empty:
                 print(f"⚠️ No data found in {csv_path}")
                 return 0
             
-            # Count of added records
-            added_count = 0
-            
             # Always create new records for each row in the DataFrame
+            pages = []
             for _, row in df.iterrows():
                 student_name = row["student_name"]
                 
@@ -289,7 +408,28 @@ class NotionClient:
                 
                 # Prepare properties for Notion
                 properties = self._prepare_page_properties(row)
-                
+                if self.batch_pointer is not None:
+                    properties.update(batch_properties)
+                pages.append((student_name, properties))
+            
+            # The new pages reach the mirror with the next refresh
+            self._mirror_refreshed = False
+            
+            if NOTION_UPLOAD_MODE == "async":
+                # Pages are created concurrently; failures are collected in the result
+                result = AsyncNotionRunner(NOTION_API_KEY).create_pages(self.database_id, pages)
+                self.last_upload_result = result
+                print(f"{'✅' if not result.failed else '⚠️'} {result.summary()}")
+                self.last_sync_summary = {"created": result.succeeded_count, "updated": 0, "skipped": 0,
+                                          "failed": result.failed_count}
+                if self.batch_pointer is not None and result.succeeded_count:
+                    self._move_batch_pointer(batch_id)
+                return result.succeeded_count
+            
+            # Count of added records
+            added_count = 0
+            
+            for student_name, properties in pages:
                 # Create a new page in the database
                 try:
                     self.client.pages.create(
@@ -301,8 +441,113 @@ class NotionClient:
                 except Exception as e:
                     print(f"⚠️ Error adding record for student {student_name}: {str(e)}")
             
+            self.last_sync_summary = {"created": added_count, "updated": 0, "skipped": 0,
+                                      "failed": len(pages) - added_count}
+            if self.batch_pointer is not None and added_count:
+                self._move_batch_pointer(batch_id)
             return added_count
             
         except Exception as e:
             print(f"⚠️ Error processing CSV: {str(e)}")
-            return 0 
\ No newline at end of file
+            return 0
+    
+    def sync_student_records(self, csv_path: str) -> int:
+        """
+        Bring every student's single Notion page in line with the latest batch in the CSV.
+        Decisions are made locally from the mirror, refreshed with a delta first: a student's
+        page is their newest latest batch page, and its stored properties are compared with
+        the row. New students get a page, changed students get only their changed properties
+        (plus Update Batch), unchanged students are skipped, and older duplicate latest batch
+        pages of a student are unflagged.
+        Returns the number of pages created or updated; counts are kept in last_sync_summary.
+        """
+        summary = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
+        self.last_sync_summary = summary
+        
+        # Pages edited since the last sync (including by this client's earlier writes)
+        self._mirror_refreshed = False
+        if not self._refresh_mirror():
+            print("⚠️ Diff sync needs the Notion mirror (NOTION_MIRROR_PATH); nothing synced")
+            return 0
+        
+        try:
+            # Read the latest batch - N/A and empty cells are loaded as NaN
+            df = load_notion_grades(csv_path)
+            df = df.astype(object).where(df.notna(), None)
+            df['Is Latest Batch'] = True
+            
+            if df.empty:
+                print(f"⚠️ No data found in {csv_path}")
+                return 0
+            
+            # The newest latest batch page of each student is theirs; older flagged ones are duplicates
+            owned = {}
+            duplicates = []
+            for page_id, student_name, stored in self.mirror.latest_batch_properties():
+                if student_name in owned:
+                    duplicates.append((student_name, owned[student_name][0]))
+                owned[student_name] = (page_id, stored)
+            
+            # (student_name, page_id or None to create, properties) per student that changed
+            jobs = []
+            for _, row in df.iterrows():
+                student_name = row["student_name"]
+                properties = self._prepare_page_properties(row)
+                
+                if student_name not in owned:
+                    jobs.append((student_name, None, properties))
+                    continue
+                
+                page_id, stored = owned[student_name]
+                changed = {
+                    name: value for name, value in properties.items()
+                    if name not in DIFF_EXCLUDED_PROPERTIES and stored.get(name) != plain_value(value)
+                }
+                if not changed:
+                    summary["skipped"] += 1
+                    continue
+                if "Update Batch" in properties:
+                    changed["Update Batch"] = properties["Update Batch"]
+                jobs.append((student_name, page_id, changed))
+            
+            print(f"Notion sync: {sum(1 for job in jobs if job[1] is None)} to create, "
+                  f"{sum(1 for job in jobs if job[1] is not None)} to update, {summary['skipped']} unchanged"
+                  + (f", {len(duplicates)} duplicate pages to unflag" if duplicates else ""))
+            jobs.extend((student_name, page_id, RESET_PROPERTIES) for student_name, page_id in duplicates)
+            
+            # (student_name, page_id) of every job that failed, and pages that no longer exist
+            failed = set()
+            missing_ids = []
+            if jobs and NOTION_UPLOAD_MODE == "async":
+                result = AsyncNotionRunner(NOTION_API_KEY).write_pages(self.database_id, jobs)
+                self.last_upload_result = result
+                failed = {(entry["student_name"], entry["page_id"]) for entry in result.failed}
+                missing_ids = [entry["page_id"] for entry in result.failed if entry["status"] == 404]
+            else:
+                for student_name, page_id, properties in jobs:
+                    try:
+                        if page_id is None:
+                            self.client.pages.create(parent={"database_id": self.database_id}, properties=properties)
+                        else:
+                            self.client.pages.update(page_id=page_id, properties=properties)
+                    except Exception as e:
+                        print(f"⚠️ Error syncing record for student {student_name}: {str(e)}")
+                        failed.add((student_name, page_id))
+                        if getattr(e, "status", None) == 404:
+                            missing_ids.append(page_id)
+            
+            for student_name, page_id, properties in jobs[:len(jobs) - len(duplicates)]:
+                if (student_name, page_id) in failed:
+                    summary["failed"] += 1
+                else:
+                    summary["created" if page_id is None else "updated"] += 1
+            # Pages deleted in Notion: the next sync creates the student's page again
+            self.mirror.remove(missing_ids)
+            
+            print(f"{'✅' if not failed else '⚠️'} Notion sync: {summary['created']} created, "
+                  f"{summary['updated']} updated, {summary['skipped']} skipped, {summary['failed']} failed")
+            return summary["created"] + summary["updated"]
+            
+        except Exception as e:
+            print(f"⚠️ Error syncing CSV: {str(e)}")
+            return summary["created"] + summary["updated"]
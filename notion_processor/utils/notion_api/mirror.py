@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Local SQLite mirror of the Notion grades database
+Holds every page's id, student, batch, latest flag and plain property values, and is
+refreshed incrementally: each refresh asks Notion only for pages edited since the newest
+last_edited_time already mirrored, so lookups (existing students, latest-batch pages)
+and the diff sync's comparisons are answered locally.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Add the repository root to the path so the module can run as a script
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import NOTION_MIRROR_PATH
+from utils.error_handler import logger
+
+# Pages per database query response (Notion's maximum)
+QUERY_PAGE_SIZE = 100
+
+def plain_value(prop: Dict) -> Any:
+    """Plain Python value of a Notion property, as returned by the API or as sent in a request"""
+    # Request values carry no "type" key; their only key is the type
+    prop_type = prop.get("type") or next(iter(prop), None)
+    value = prop.get(prop_type)
+    if prop_type in ("title", "rich_text"):
+        return "".join(
+            part.get("plain_text", part.get("text", {}).get("content", "")) for part in value or []
+        )
+    if prop_type == "select":
+        return value.get("name") if value else None
+    if prop_type == "date":
+        return value.get("start") if value else None
+    return value
+
+class NotionMirror:
+    """
+    Notion database pages mirrored in SQLite (WAL mode).
+
+    The meta table keeps the database id the mirror belongs to and the refresh
+    cursor (the newest last_edited_time seen). Notion rounds last_edited_time to
+    the minute, so a delta refresh asks for pages edited on or after the cursor
+    and upserts them; the overlap is harmless. Pages archived in Notion are not
+    returned by database queries, so only a full refresh drops them.
+    """
+
+    def __init__(self, db_path: str, database_id: str):
+        self.db_path = db_path
+        self.database_id = database_id
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                student_name TEXT,
+                update_batch TEXT,
+                is_latest_batch INTEGER NOT NULL DEFAULT 0,
+                created_time TEXT,
+                last_edited_time TEXT,
+                properties TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_student ON pages (student_name)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_latest ON pages (is_latest_batch)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        # A mirror of another database is useless; start over
+        if self._get_meta("database_id") not in (None, self.database_id):
+            logger.info(f"Notion mirror {self.db_path} belongs to another database; clearing it")
+            self.clear()
+        self._set_meta("database_id", self.database_id)
+        self.conn.commit()
+
+    def close(self) -> None:
+        """Close the database connection"""
+        self.conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Optional[str]) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def clear(self) -> None:
+        """Forget every mirrored page and the refresh cursor"""
+        with self._lock:
+            self.conn.execute("DELETE FROM pages")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('cursor', 'refreshed_at')")
+            self.conn.commit()
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Newest last_edited_time mirrored (None before the first refresh)"""
+        return self._get_meta("cursor")
+
+    def _upsert(self, page: Dict) -> None:
+        properties = {name: plain_value(prop) for name, prop in page.get("properties", {}).items()}
+        self.conn.execute("""
+            INSERT OR REPLACE INTO pages
+                (page_id, student_name, update_batch, is_latest_batch, created_time, last_edited_time, properties)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            page["id"],
+            properties.get("student_name"),
+            properties.get("Update Batch"),
+            1 if properties.get("Is Latest Batch") == "True" else 0,
+            page.get("created_time"),
+            page.get("last_edited_time"),
+            json.dumps(properties, ensure_ascii=False)
+        ))
+
+    def upsert_pages(self, pages: Iterable[Dict]) -> int:
+        """Store full page objects (query results or create/update responses)"""
+        count = 0
+        with self._lock:
+            for page in pages:
+                if page.get("archived") or page.get("in_trash"):
+                    self.conn.execute("DELETE FROM pages WHERE page_id = ?", (page["id"],))
+                else:
+                    self._upsert(page)
+                count += 1
+            self.conn.commit()
+        return count
+
+    def refresh(self, client, full: bool = False) -> int:
+        """
+        Bring the mirror up to date through a notion_client Client. Without a cursor (or
+        with full) every page is fetched and pages no longer returned are dropped;
+        otherwise only pages edited since the cursor are fetched. Returns pages fetched.
+        """
+        cursor = None if full else self.cursor
+        body = {
+            "page_size": QUERY_PAGE_SIZE,
+            "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]
+        }
+        if cursor:
+            body["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": cursor}}
+
+        seen = set()
+        fetched = 0
+        next_cursor = None
+        while True:
+            if next_cursor:
+                body["start_cursor"] = next_cursor
+            response = client.request(path=f"databases/{self.database_id}/query", method="POST", body=body)
+            results = response.get("results", [])
+            fetched += self.upsert_pages(results)
+            seen.update(page["id"] for page in results)
+
+            # Results come oldest edit first, so the cursor can move after every response
+            if results and not full and cursor is not None:
+                with self._lock:
+                    self._set_meta("cursor", results[-1]["last_edited_time"])
+                    self.conn.commit()
+            next_cursor = response.get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
+                break
+
+        with self._lock:
+            if cursor is None:
+                # A full scan saw every live page; anything else was archived or deleted
+                existing = [row[0] for row in self.conn.execute("SELECT page_id FROM pages")]
+                self.conn.executemany("DELETE FROM pages WHERE page_id = ?",
+                                      [(page_id,) for page_id in existing if page_id not in seen])
+            newest = self.conn.execute("SELECT MAX(last_edited_time) FROM pages").fetchone()[0]
+            if newest:
+                self._set_meta("cursor", newest)
+            self._set_meta("refreshed_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            self.conn.commit()
+
+        logger.info(f"Notion mirror refresh ({'full' if cursor is None else 'delta'}): {fetched} pages fetched")
+        return fetched
+
+    def student_names(self) -> List[str]:
+        """Student name of every mirrored page, in creation order"""
+        rows = self.conn.execute("""
+            SELECT student_name FROM pages WHERE student_name IS NOT NULL ORDER BY created_time, page_id
+        """)
+        return [row[0] for row in rows]
+
+    def latest_batch_pages(self) -> List[Tuple[str, Optional[str]]]:
+        """(page_id, student_name) of every page flagged as the latest batch"""
+        rows = self.conn.execute("""
+            SELECT page_id, student_name FROM pages WHERE is_latest_batch = 1 ORDER BY created_time, page_id
+        """)
+        return [(row[0], row[1]) for row in rows]
+
+    def latest_batch_properties(self) -> List[Tuple[str, Optional[str], Dict[str, Any]]]:
+        """(page_id, student_name, plain properties) of every latest batch page, oldest first"""
+        rows = self.conn.execute("""
+            SELECT page_id, student_name, properties FROM pages WHERE is_latest_batch = 1 ORDER BY created_time, page_id
+        """)
+        return [(row[0], row[1], json.loads(row[2] or "{}")) for row in rows]
+
+    def set_latest_flags(self, page_ids: Iterable[str], is_latest: bool) -> None:
+        """Record Is Latest Batch changes written to Notion"""
+        flag = "True" if is_latest else "False"
+        with self._lock:
+            for page_id in page_ids:
+                row = self.conn.execute("SELECT properties FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+                if row is None:
+                    continue
+                properties = json.loads(row[0] or "{}")
+                properties["Is Latest Batch"] = flag
+                self.conn.execute(
+                    "UPDATE pages SET is_latest_batch = ?, properties = ? WHERE page_id = ?",
+                    (1 if is_latest else 0, json.dumps(properties, ensure_ascii=False), page_id)
+                )
+            self.conn.commit()
+
+    def remove(self, page_ids: Iterable[str]) -> None:
+        """Drop pages that no longer exist in Notion"""
+        with self._lock:
+            self.conn.executemany("DELETE FROM pages WHERE page_id = ?", [(page_id,) for page_id in page_ids])
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Mirrored pages, students and refresh state"""
+        pages, students, latest = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT student_name), COALESCE(SUM(is_latest_batch), 0) FROM pages"
+        ).fetchone()
+        return {
+            "pages": pages,
+            "students": students,
+            "latest_batch_pages": latest,
+            "cursor": self.cursor,
+            "refreshed_at": self._get_meta("refreshed_at")
+        }
+
+def main():
+    """Command line entry point for refreshing and inspecting the Notion mirror"""
+    from notion_client import Client
+    from notion_processor.utils.notion_api.config import NOTION_API_KEY, NOTION_DATABASE_ID
+
+    parser = argparse.ArgumentParser(description="Manage the local SQLite mirror of the Notion grades database")
+    parser.add_argument("--db", default=os.path.join(parent_dir, NOTION_MIRROR_PATH), help="Path to the mirror database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = subparsers.add_parser("refresh", help="Fetch pages edited since the last refresh")
+    refresh_parser.add_argument("--full", action="store_true", help="Fetch every page and drop archived ones")
+    subparsers.add_parser("stats", help="Print mirrored pages and the refresh cursor")
+    subparsers.add_parser("students", help="Print the students of the latest batch pages")
+
+    args = parser.parse_args()
+    mirror = NotionMirror(args.db, NOTION_DATABASE_ID)
+    try:
+        if args.command == "refresh":
+            fetched = mirror.refresh(Client(auth=NOTION_API_KEY), full=args.full)
+            print(f"✅ Refreshed {args.db}: {fetched} pages fetched")
+        elif args.command == "stats":
+            stats = mirror.stats()
+            print(f"{stats['pages']} pages for {stats['students']} students, {stats['latest_batch_pages']} in the "
+                  f"latest batch (cursor {stats['cursor']}, refreshed {stats['refreshed_at']})")
+        elif args.command == "students":
+            for page_id, student_name in mirror.latest_batch_pages():
+                print(f"{student_name}\t{page_id}")
+    finally:
+        mirror.close()
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
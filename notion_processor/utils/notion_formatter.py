@@ -1,11 +1,11 @@
 import csv
 import os
 import pandas as pd
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import Callable, List, Dict, Any, Optional
+from datetime import datetime, timedelta
 import sys
 import logging
-from config import COURSE_NAME_TO_CHINESE
+from config import COURSE_NAME_TO_CHINESE, GRADES_LOOKBACK_DAYS, GRADES_READ_CHUNK_ROWS, NOTION_GRADES_OUTPUT_MODE
 
 # Ensure parent directory is in path to import from root
 parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,11 +15,31 @@ if parent_dir not in sys.path:
 # Now import from the parent project
 from utils.error_handler import handle_file_error
 from notion_processor.utils.batch_manager import get_current_batch
+from utils.grade_partitions import iter_grade_frames
+from utils.grade_loader import (
+    coerce_grades, iter_grade_chunks, load_grades, load_notion_grades, load_notion_history,
+    read_latest_batch, reduce_latest, write_latest_batch, write_latest_view
+)
+from utils.student_identity import get_student_index
+
+# Scores are written back to notion_grades.csv, so keep every decimal (float32 keeps ~7 digits)
+SCORE_DTYPE = "float64"
 
 class NotionFormatter:
-    def __init__(self, input_csv_path: str, output_csv_path: str):
+    def __init__(self, input_csv_path: str, output_csv_path: str, grade_store=None,
+                 lookback_days: int = GRADES_LOOKBACK_DAYS, chunk_rows: int = GRADES_READ_CHUNK_ROWS,
+                 output_mode: str = NOTION_GRADES_OUTPUT_MODE):
+        # A grades CSV, or a directory of grade partitions (see utils/grade_partitions.py)
         self.input_csv_path = input_csv_path
         self.output_csv_path = output_csv_path
+        # Days of partitioned history to read (0 = all)
+        self.lookback_days = lookback_days
+        # Rows per chunk when streaming a single grades CSV (0 = load it whole)
+        self.chunk_rows = chunk_rows
+        # "incremental" appends each batch to the output CSV, "rewrite" rewrites it every run
+        self.output_mode = output_mode
+        # Optional GradeStore; when it holds grades, the latest rows come from SQLite instead of the CSV
+        self.grade_store = grade_store
         self._ensure_directory()
 
     def _ensure_directory(self) -> None:
@@ -49,26 +69,218 @@ class NotionFormatter:
             
         return chinese_to_english
         
+    def _load_latest_grades(self) -> Optional[pd.DataFrame]:
+        """Get the latest grade row per (student, course), ordered by fetch time, or None if there is no data"""
+        # The store stands in for the CSV history only once that history was imported into it
+        if self.grade_store is not None and self.grade_store.has_history():
+            return coerce_grades(pd.DataFrame(self.grade_store.latest()), score_dtype=SCORE_DTYPE)
+
+        # Check if input file exists
+        if not os.path.exists(self.input_csv_path):
+            print(f"⚠️ Input file {self.input_csv_path} does not exist.")
+            return None
+
+        if os.path.isdir(self.input_csv_path):
+            grades_df = self._read_partitions()
+        elif self.chunk_rows:
+            # Only the running latest row per pair is kept, so long histories don't have to fit in memory
+            grades_df = reduce_latest(iter_grade_chunks(self.input_csv_path, self.chunk_rows, SCORE_DTYPE))
+        else:
+            grades_df = load_grades(self.input_csv_path, score_dtype=SCORE_DTYPE)
+
+        if grades_df.empty:
+            print(f"⚠️ No data found in {self.input_csv_path}")
+            return None
+
+        # Get the most recent data from the input CSV
+        return grades_df.sort_values('fetch_time').drop_duplicates(
+            subset=['student_name', 'course_name'],
+            keep='last'
+        )
+
+    def _read_partitions(self) -> pd.DataFrame:
+        """Stream the day/month partitions inside the lookback window, keeping only the latest row per pair"""
+        since = None
+        if self.lookback_days:
+            since = (datetime.now() - timedelta(days=self.lookback_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+        return reduce_latest(iter_grade_frames(self.input_csv_path, since, score_dtype=SCORE_DTYPE))
+
+    def _get_course_columns(self) -> List[str]:
+        """Get the English course columns in config order (several Chinese names may share one)"""
+        chinese_to_english = self._get_course_chinese_to_english_map()
+        return list(dict.fromkeys(
+            chinese_to_english.get(course_chinese, course_chinese)
+            for course_chinese in self._get_all_possible_courses()
+        ))
+
+    def _fill_missing_names(self, names: pd.Series, fallback: Callable[[str], str], label: str) -> pd.Series:
+        """Fill empty student names (indexed by student_name) from the student identity index"""
+        names = names.astype(object)
+        missing = names.isna() | (names == "")
+        filled = [fallback(student_name) for student_name in names.index[missing]]
+        for student_name, name in zip(names.index[missing], filled):
+            print(f"Using fallback {label} name for {student_name}: {name}")
+        names[missing] = filled
+        return names.fillna("")
+
+    def _build_wide_frame(self, latest_grades: pd.DataFrame, current_batch: str) -> pd.DataFrame:
+        """
+        Pivot the latest (student, course) rows into one row per student: student names,
+        Is Latest Batch, every configured course ("N/A" when not enrolled), courses missing
+        from the config, Updated Time (the student's latest fetch) and Update Batch
+        """
+        chinese_to_english = self._get_course_chinese_to_english_map()
+        course_columns = self._get_course_columns()
+
+        # Students in groupby order, with their first row's names and latest fetch time
+        latest_fetch_times = latest_grades.groupby('student_name', observed=True)['fetch_time'].max()
+        students = latest_fetch_times.index
+        first_rows = latest_grades.drop_duplicates('student_name', keep='first').set_index('student_name')
+        first_rows = first_rows.reindex(students)
+
+        # Course column per row; later rows win when two courses share an English name
+        course_chinese = latest_grades['course_name_chinese'].astype(object)
+        grades = pd.DataFrame({
+            'student_name': latest_grades['student_name'].astype(object).to_numpy(),
+            'column': course_chinese.map(chinese_to_english).fillna(course_chinese).to_numpy(),
+            'score': latest_grades['score'].to_numpy()
+        })
+        grades = grades.drop_duplicates(['student_name', 'column'], keep='last')
+
+        # Courses missing from the config follow in the order students first show them
+        student_order = pd.Series(range(len(students)), index=students.astype(object))
+        extra = grades[~grades['column'].isin(course_columns)]
+        extra = extra.iloc[extra['student_name'].map(student_order).argsort(kind='stable')]
+        columns = course_columns + list(extra['column'].unique())
+
+        # Enrolled courses keep their score (NaN stays empty); configured courses are
+        # "N/A" when the student is not enrolled, courses missing from the config are empty
+        keys = pd.MultiIndex.from_frame(grades[['student_name', 'column']])
+        scores = pd.Series(grades['score'].to_numpy(), index=keys).unstack()
+        enrolled = pd.Series(True, index=keys).unstack(fill_value=False)
+        scores = scores.reindex(index=student_order.index, columns=columns).astype(object)
+        enrolled = enrolled.reindex(index=student_order.index, columns=course_columns, fill_value=False)
+        scores[course_columns] = scores[course_columns].where(enrolled.to_numpy(), "N/A")
+
+        student_index = get_student_index()
+        wide = pd.DataFrame({
+            'student_name': student_order.index,
+            'student_chinese_name': self._fill_missing_names(
+                first_rows['student_chinese_name'], student_index.chinese_name, "Chinese").to_numpy(),
+            'student_english_name': self._fill_missing_names(
+                first_rows['student_english_name'], student_index.english_name, "English").to_numpy(),
+            'Is Latest Batch': True
+        })
+        wide = pd.concat([wide, scores.reset_index(drop=True)], axis=1)
+        wide['Updated Time'] = latest_fetch_times.dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+        wide['Update Batch'] = current_batch
+        # Columns where every student has a score become float, as with row-by-row construction
+        return wide.infer_objects()
+
+    def _order_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Put Is Latest Batch after the student name columns and Updated Time / Update Batch last"""
+        trailing = [col for col in ['Updated Time', 'Update Batch'] if col in df.columns]
+        columns = [col for col in df.columns if col not in trailing and col != 'Is Latest Batch']
+        if 'Is Latest Batch' in df.columns:
+            columns.insert(3, 'Is Latest Batch')
+        return df[columns + trailing]
+
+    def _read_output_header(self) -> List[str]:
+        """Get the output CSV's column names ([] when there is no file yet)"""
+        if not os.path.exists(self.output_csv_path) or os.path.getsize(self.output_csv_path) == 0:
+            return []
+        with open(self.output_csv_path, 'r', newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), [])
+
+    def _count_output_rows(self) -> int:
+        """Count the data rows of the output CSV (used when the latest-batch pointer is out of date)"""
+        with open(self.output_csv_path, 'r', newline='', encoding='utf-8') as f:
+            return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+    def _append_batch(self, new_df: pd.DataFrame, all_courses_chinese: List[str]) -> None:
+        """
+        Append this batch's rows to the output CSV and point the latest-batch sidecar at
+        them. Earlier rows are never rewritten; readers derive Is Latest Batch and the
+        latest row per student from the sidecar (see utils/grade_loader.load_notion_grades).
+        The file is rewritten only when it is new, still in the rewrite layout or gains a column.
+        """
+        rows = self._order_columns(new_df.drop(columns=['Is Latest Batch']))
+        header = self._read_output_header()
+        latest = read_latest_batch(self.output_csv_path)
+        previous_view = load_notion_grades(self.output_csv_path) if header else None
+
+        appendable = (
+            header and latest is not None and 'Is Latest Batch' not in header
+            and set(rows.columns) <= set(header)
+        )
+        if appendable:
+            if latest.get('size') == os.path.getsize(self.output_csv_path):
+                start_row = latest['total_rows']
+            else:
+                start_row = self._count_output_rows()
+            # Courses only earlier batches had stay "N/A"
+            rows = rows.reindex(columns=header, fill_value="N/A")
+            with open(self.output_csv_path, 'a', newline='', encoding='utf-8') as f:
+                rows.to_csv(f, header=False, index=False)
+            print(f"✅ Appended {len(rows)} records to Notion grades file at {self.output_csv_path}")
+        else:
+            start_row = self._rewrite_history(rows, all_courses_chinese)
+
+        # The view goes first: the pointer's file size is what marks it current
+        write_latest_view(self.output_csv_path, self._latest_view(previous_view, rows))
+        write_latest_batch(self.output_csv_path, {
+            'batch': get_current_batch(),
+            'start_row': start_row,
+            'rows': len(rows),
+            'total_rows': start_row + len(rows),
+            'size': os.path.getsize(self.output_csv_path)
+        })
+        print(f"   Format: {len(rows)} students with {len(rows.columns) - 5} course score columns")
+
+    def _latest_view(self, previous_view: Optional[pd.DataFrame], rows: pd.DataFrame) -> pd.DataFrame:
+        """One row per student: this batch's rows (flagged latest) after the earlier view's other students"""
+        batch = rows.copy()
+        batch['Is Latest Batch'] = True
+        if previous_view is None:
+            return self._order_columns(batch)
+
+        earlier = previous_view[~previous_view['student_name'].isin(batch['student_name'])].copy()
+        earlier['Is Latest Batch'] = False
+        columns = list(self._read_output_header()) + ['Is Latest Batch']
+        view = pd.concat([earlier, batch], ignore_index=True)
+        return self._order_columns(view.reindex(columns=columns, fill_value="N/A"))
+
+    def _rewrite_history(self, rows: pd.DataFrame, all_courses_chinese: List[str]) -> int:
+        """Write the existing rows (without a stored Is Latest Batch column) plus this batch; returns the batch's first row"""
+        if not self._read_output_header():
+            rows.to_csv(self.output_csv_path, index=False)
+            print(f"✅ Successfully created new Notion grades file at {self.output_csv_path}")
+            return 0
+
+        history = load_notion_history(self.output_csv_path)
+        # Legacy columns: the unknown-course bucket, Chinese course names and the stored flag
+        legacy_columns = [col for col in history.columns if col == "未知课程" or col in all_courses_chinese]
+        history = history.drop(columns=legacy_columns + ['Is Latest Batch'], errors='ignore')
+        for col in rows.columns:
+            if col not in history.columns:
+                history[col] = "N/A"
+        for col in history.columns:
+            if col not in rows.columns:
+                rows[col] = "N/A"
+
+        combined = self._order_columns(pd.concat([history, rows], ignore_index=True))
+        combined.to_csv(self.output_csv_path, index=False)
+        print(f"✅ Rewrote Notion grades file at {self.output_csv_path} with {len(rows)} new records after {len(history)} earlier records")
+        return len(history)
+
     def transform_grades_for_notion(self) -> None:
         """Transform grades data into Notion-friendly format"""
         try:
-            # Check if input file exists
-            if not os.path.exists(self.input_csv_path):
-                print(f"⚠️ Input file {self.input_csv_path} does not exist.")
+            # Get the most recent grades for each student and course
+            latest_grades = self._load_latest_grades()
+            if latest_grades is None:
                 return
-                
-            # Read the grades CSV
-            grades_df = pd.read_csv(self.input_csv_path)
-            
-            if grades_df.empty:
-                print(f"⚠️ No data found in {self.input_csv_path}")
-                return
-                
-            # Extract the latest data by grouping by student name and taking the latest fetch_time
-            # This ensures we only get the most recent grades for each student and course
-            grades_df['fetch_time'] = pd.to_datetime(grades_df['fetch_time'])
-            latest_grades = grades_df.sort_values('fetch_time').groupby(['student_name', 'course_name']).last()
-            latest_grades = latest_grades.reset_index()
             
             # Create a pivot table with students as rows and courses as columns
             # Use Chinese course names for column headers and include only scores (no grades)
@@ -104,26 +316,10 @@ class NotionFormatter:
     def transform_long_to_wide(self) -> None:
         """Transform long format to wide format for Notion and append to existing data"""
         try:
-            # Read the grades CSV
-            if not os.path.exists(self.input_csv_path):
-                print(f"⚠️ Input file {self.input_csv_path} does not exist.")
-                return
-                
-            grades_df = pd.read_csv(self.input_csv_path)
-            
-            if grades_df.empty:
-                print(f"⚠️ No data found in {self.input_csv_path}")
+            # Get the most recent data for each student and course
+            latest_grades = self._load_latest_grades()
+            if latest_grades is None:
                 return
-                
-            # Get the most recent data from the input CSV
-            grades_df['fetch_time'] = pd.to_datetime(grades_df['fetch_time'])
-            latest_grades = grades_df.sort_values('fetch_time').drop_duplicates(
-                subset=['student_name', 'course_name'], 
-                keep='last'
-            )
-            
-            # Get the latest fetch time for each student to use as a combined "Updated Time"
-            latest_fetch_times = latest_grades.groupby('student_name')['fetch_time'].max()
             
             # Get all possible course names from config
             all_courses_chinese = self._get_all_possible_courses()
@@ -131,77 +327,18 @@ class NotionFormatter:
             # Get Chinese to English course name mapping
             chinese_to_english = self._get_course_chinese_to_english_map()
             
-            # Get current update batch
-            current_batch = get_current_batch()
+            # Build one row per student with every course column
+            new_df = self._build_wide_frame(latest_grades, get_current_batch())
             
-            # Prepare the new data
-            new_data = []
-            
-            # Group by student
-            for student_name, group in latest_grades.groupby('student_name'):
-                # Extract student names - make sure they are not empty strings or NaN
-                student_cn_name = group['student_chinese_name'].iloc[0] 
-                if pd.isna(student_cn_name) or student_cn_name == "":
-                    # Try to get from STUDENT_TO_CHINESE_NAME mapping as fallback
-                    try:
-                        # Re-import to get the most updated data
-                        import sys
-                        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config"))
-                        from config import STUDENT_TO_CHINESE_NAME
-                        student_cn_name = STUDENT_TO_CHINESE_NAME.get(student_name, "")
-                        print(f"Using fallback Chinese name for {student_name}: {student_cn_name}")
-                    except Exception as e:
-                        print(f"Error loading Chinese name for {student_name}: {str(e)}")
-                        student_cn_name = ""
-                
-                student_en_name = group['student_english_name'].iloc[0]
-                if pd.isna(student_en_name) or student_en_name == "":
-                    # Try to get from STUDENT_TO_PREFERRED_ENGLISH_NAME mapping as fallback
-                    try:
-                        # Re-import to get the most updated data
-                        import sys
-                        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config"))
-                        from config import STUDENT_TO_PREFERRED_ENGLISH_NAME
-                        student_en_name = STUDENT_TO_PREFERRED_ENGLISH_NAME.get(student_name, "")
-                        print(f"Using fallback English name for {student_name}: {student_en_name}")
-                    except Exception as e:
-                        print(f"Error loading English name for {student_name}: {str(e)}")
-                        student_en_name = ""
-                
-                row = {
-                    'student_name': student_name,
-                    'student_chinese_name': student_cn_name if not pd.isna(student_cn_name) else "",
-                    'student_english_name': student_en_name if not pd.isna(student_en_name) else "",
-                    'Is Latest Batch': True  # Set to True for all new records
-                }
-                
-                # Initialize all course columns with None or N/A
-                for course_name_chinese in all_courses_chinese:
-                    course_name_english = chinese_to_english.get(course_name_chinese, course_name_chinese)
-                    row[course_name_english] = "N/A"
-                
-                # Add each course's score (without grade) for courses the student is enrolled in
-                for _, course_row in group.iterrows():
-                    course_name_chinese = course_row['course_name_chinese']
-                    course_name_english = chinese_to_english.get(course_name_chinese, course_name_chinese)
-                    row[course_name_english] = course_row['score']
-                
-                # Add the Updated Time (will be moved to the end later)
-                row['Updated Time'] = latest_fetch_times[student_name].strftime("%Y-%m-%d %H:%M:%S")
-                
-                # Add the Update Batch
-                row['Update Batch'] = current_batch
-                
-                new_data.append(row)
-            
-            # Create DataFrame for the new data
-            new_df = pd.DataFrame(new_data)
+            if self.output_mode == "incremental":
+                self._append_batch(new_df, all_courses_chinese)
+                return
             
             # Check if the output file exists and has data
             if os.path.exists(self.output_csv_path) and os.path.getsize(self.output_csv_path) > 0:
                 # Read existing Notion grades CSV
                 try:
-                    existing_df = pd.read_csv(self.output_csv_path)
+                    existing_df = load_notion_grades(self.output_csv_path)
                     
                     # Remove the "未知课程" column if it exists
                     if "未知课程" in existing_df.columns:
@@ -241,21 +378,8 @@ class NotionFormatter:
                     # Append new data to existing data
                     combined_df = pd.concat([existing_df, new_df], ignore_index=True)
                     
-                    # Ensure Is Latest Batch is in the middle (not at the end)
-                    if 'Is Latest Batch' in combined_df.columns:
-                        is_latest_batch = combined_df.pop('Is Latest Batch')
-                        # Insert after the student name columns but before course columns
-                        combined_df.insert(3, 'Is Latest Batch', is_latest_batch)
-                    
-                    # Move the Updated Time column to the end
-                    if 'Updated Time' in combined_df.columns:
-                        updated_time = combined_df.pop('Updated Time')
-                        combined_df['Updated Time'] = updated_time
-                        
-                    # Move the Update Batch column to the end
-                    if 'Update Batch' in combined_df.columns:
-                        update_batch = combined_df.pop('Update Batch')
-                        combined_df['Update Batch'] = update_batch
+                    # Is Latest Batch after the student names, Updated Time and Update Batch at the end
+                    combined_df = self._order_columns(combined_df)
                     
                     # Save the combined data
                     combined_df.to_csv(self.output_csv_path, index=False)
@@ -265,37 +389,13 @@ class NotionFormatter:
                 except Exception as e:
                     print(f"⚠️ Error reading existing file, creating new one: {str(e)}")
                     
-                    # Move Is Latest Batch to the middle
-                    if 'Is Latest Batch' in new_df.columns:
-                        is_latest_batch = new_df.pop('Is Latest Batch')
-                        new_df.insert(3, 'Is Latest Batch', is_latest_batch)
-                    
-                    # Move the Updated Time column to the end
-                    if 'Updated Time' in new_df.columns:
-                        updated_time = new_df.pop('Updated Time')
-                        new_df['Updated Time'] = updated_time
-                        
-                    # Move the Update Batch column to the end
-                    if 'Update Batch' in new_df.columns:
-                        update_batch = new_df.pop('Update Batch')
-                        new_df['Update Batch'] = update_batch
+                    # Is Latest Batch after the student names, Updated Time and Update Batch at the end
+                    new_df = self._order_columns(new_df)
                         
                     new_df.to_csv(self.output_csv_path, index=False)
             else:
-                # Move Is Latest Batch to the middle
-                if 'Is Latest Batch' in new_df.columns:
-                    is_latest_batch = new_df.pop('Is Latest Batch')
-                    new_df.insert(3, 'Is Latest Batch', is_latest_batch)
-                
-                # Move the Updated Time column to the end
-                if 'Updated Time' in new_df.columns:
-                    updated_time = new_df.pop('Updated Time')
-                    new_df['Updated Time'] = updated_time
-                    
-                # Move the Update Batch column to the end
-                if 'Update Batch' in new_df.columns:
-                    update_batch = new_df.pop('Update Batch')
-                    new_df['Update Batch'] = update_batch
+                # Is Latest Batch after the student names, Updated Time and Update Batch at the end
+                new_df = self._order_columns(new_df)
                 
                 # Save as a new file
                 new_df.to_csv(self.output_csv_path, index=False)
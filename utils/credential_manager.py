@@ -1,8 +1,8 @@
 import json
 import os
-import requests
 from typing import Dict, Optional
 from utils.error_handler import handle_api_error, handle_credentials_error
+from utils.http_client import canvas_get
 
 class CredentialManager:
     def __init__(self, credentials_file: str = "config/credentials.json"):
@@ -58,7 +58,7 @@ class CredentialManager:
             headers = {"Authorization": f"Bearer {api_key}"}
             url = f"https://{domain}/api/v1/users/self/profile"
             
-            response = requests.get(url, headers=headers)
+            response = canvas_get(domain, url, headers=headers)
             if response.status_code == 200:
                 # Get the Canvas student name
                 canvas_name = response.json().get("name")
@@ -150,7 +150,7 @@ class CredentialManager:
             url = f"https://{domain}/api/v1/users/self/profile"
             headers = {"Authorization": f"Bearer {api_key}"}
             
-            response = requests.get(url, headers=headers)
+            response = canvas_get(domain, url, headers=headers)
             
             if response.status_code == 200:
                 return True
@@ -1,11 +1,74 @@
 import csv
+import io
 import os
-from typing import List, Dict, Any
-from utils.error_handler import handle_file_error
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator
+from config import GRADES_BUFFER_SPILL_ROWS
+from utils.error_handler import handle_file_error, logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+GRADE_FIELDNAMES = [
+    "student_name", "student_chinese_name", "student_english_name",
+    "course_name", "course_name_chinese", "score", "grade", "fetch_time"
+]
+
+@contextmanager
+def file_lock(lock_path: str, timeout: float = 60.0) -> Iterator[None]:
+    """Hold an exclusive lock on lock_path (flock where available, a lock file otherwise)"""
+    if fcntl is not None:
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    # Fallback: whoever creates the lock file first holds the lock
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for lock {lock_path}")
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
 
 class CSVHandler:
-    def __init__(self, file_path: str):
+    """
+    Writes grade records to grades.csv.
+
+    With buffered=True, save_grades only collects records (thread-safe, spilling
+    to a temp file past GRADES_BUFFER_SPILL_ROWS) and commit() writes them once:
+    the new file is built next to the old one and swapped in with os.replace
+    under a file lock, so a partial run never leaves a half-written CSV and
+    concurrent writers never interleave rows. Unbuffered saves append to the
+    file under the same lock, so each one costs only the rows it writes.
+    """
+
+    def __init__(self, file_path: str, grade_store=None, buffered: bool = False,
+                 spill_rows: int = GRADES_BUFFER_SPILL_ROWS):
         self.file_path = file_path
+        # Optional GradeStore that receives every saved record as well
+        self.grade_store = grade_store
+        self.buffered = buffered
+        self.spill_rows = spill_rows
+        self._lock = threading.Lock()
+        self._reset_buffer()
         self._ensure_directory()
 
     def _ensure_directory(self) -> None:
@@ -14,29 +77,145 @@ class CSVHandler:
         if directory and not os.path.exists(directory):
             os.makedirs(directory)
 
+    def _reset_buffer(self) -> None:
+        """Start an empty buffer that appends to the existing file"""
+        self._records = []
+        self._spill = None
+        self._pending = 0
+        self._append = True
+
     def save_grades(self, data: List[Dict[str, Any]], append: bool = True) -> None:
-        """Save grades data to CSV file"""
-        fieldnames = [
-            "student_name", "student_chinese_name", "student_english_name",
-            "course_name", "course_name_chinese", "score", "grade", "fetch_time"
-        ]
+        """Save grades data to CSV file (buffered until commit() in buffered mode)"""
+        with self._lock:
+            if not append:
+                # Replace the file: drop anything buffered so far
+                if self._spill is not None:
+                    self._spill.close()
+                self._reset_buffer()
+                self._append = False
+
+            self._records.extend(data)
+            self._pending += len(data)
+            if len(self._records) >= self.spill_rows:
+                self._spill_records()
+
+        if not self.buffered:
+            self.commit()
+
+    def _spill_records(self) -> None:
+        """Move buffered records to a temp file to bound memory (caller holds the lock)"""
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8')
+        writer = csv.DictWriter(self._spill, fieldnames=GRADE_FIELDNAMES)
+        writer.writerows(self._records)
+        self._records = []
+
+    def pending(self) -> int:
+        """Get the number of records waiting for commit()"""
+        with self._lock:
+            return self._pending
+
+    def commit(self) -> int:
+        """Write all buffered records to the CSV (and grade store) at once and return how many were written"""
+        with self._lock:
+            records, spill, count, append = self._records, self._spill, self._pending, self._append
+            self._reset_buffer()
+
+        if not count:
+            return 0
+
+        try:
+            try:
+                with file_lock(f"{self.file_path}.lock"):
+                    self._write_file(records, spill, append)
+                print(f"✅ Successfully saved {count} records to {self.file_path}")
+            except Exception as e:
+                handle_file_error(self.file_path, "write", e)
+
+            if self.grade_store is not None:
+                try:
+                    self.grade_store.save_grades(self._iter_records(records, spill))
+                except Exception as e:
+                    self._detach_grade_store(e)
+                    handle_file_error(self.grade_store.db_path, "write", e)
+        finally:
+            if spill is not None:
+                spill.close()
+
+        return count
+
+    def _detach_grade_store(self, error: Exception) -> None:
+        """The CSV has a batch the store is missing: make the CSV the history source again"""
+        print(f"⚠️ {self.grade_store.db_path} no longer matches {self.file_path}; reading the CSV history until "
+              f"`python utils/grade_store.py import --replace` rebuilds the store")
+        logger.error(f"Grade store {self.grade_store.db_path} is missing a batch saved to {self.file_path}: {str(error)}")
+        try:
+            self.grade_store.clear_import_record()
+        except Exception as e:
+            logger.error(f"Could not clear the history import record of {self.grade_store.db_path}: {str(e)}")
+
+    def _write_file(self, records: List[Dict[str, Any]], spill, append: bool) -> None:
+        """Write committed records: a plain append per unbuffered save, copy-and-replace for the run's commit"""
+        if append and not self.buffered:
+            self._append_file(records, spill)
+        else:
+            self._replace_file(records, spill, append)
+
+    def _append_file(self, records: List[Dict[str, Any]], spill) -> None:
+        """Append records to the end of the CSV (the caller holds the file lock)"""
+        file_exists = os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0
+        with open(self.file_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=GRADE_FIELDNAMES)
+            if not file_exists:
+                writer.writeheader()
+            if spill is not None:
+                spill.seek(0)
+                shutil.copyfileobj(spill, f)
+            writer.writerows(records)
 
+    def _replace_file(self, records: List[Dict[str, Any]], spill, append: bool) -> None:
+        """Build the new CSV in a temp file next to the old one and swap it in atomically"""
+        directory = os.path.dirname(self.file_path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.file_path)}.", suffix=".tmp")
         try:
-            # Check if file exists and has data
-            file_exists = os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0
-            
-            mode = 'a' if append and file_exists else 'w'
-            
-            with open(self.file_path, mode, newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                
+            with os.fdopen(fd, 'wb') as raw:
+                # Carry over the existing rows as raw bytes
+                file_exists = os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0
+                if append and file_exists:
+                    with open(self.file_path, 'rb') as existing:
+                        shutil.copyfileobj(existing, raw)
+
+                f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                writer = csv.DictWriter(f, fieldnames=GRADE_FIELDNAMES)
+
                 # Write header only for new files
-                if mode == 'w':
+                if not (append and file_exists):
                     writer.writeheader()
-                
-                writer.writerows(data)
-                
-            print(f"✅ Successfully saved {len(data)} records to {self.file_path}")
-            
-        except Exception as e:
-            handle_file_error(self.file_path, "write", e)
+
+                if spill is not None:
+                    spill.seek(0)
+                    shutil.copyfileobj(spill, f)
+                writer.writerows(records)
+
+                f.flush()
+                os.fsync(raw.fileno())
+                # Leave closing the file to the outer block
+                f.detach()
+
+            # mkstemp creates the file as 0600; keep the CSV's permissions
+            if os.path.exists(self.file_path):
+                shutil.copymode(self.file_path, temp_path)
+            else:
+                os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _iter_records(self, records: List[Dict[str, Any]], spill) -> Iterator[Dict[str, Any]]:
+        """Yield spilled records followed by those still in memory, in save order"""
+        if spill is not None:
+            spill.seek(0)
+            yield from csv.DictReader(spill, fieldnames=GRADE_FIELDNAMES)
+        yield from records
@@ -26,6 +26,14 @@ class APIConnectionError(CanvasAPIError):
     """Error related to Canvas API connection"""
     pass
 
+class CircuitOpenError(APIConnectionError):
+    """Error raised when requests to a Canvas domain are failing fast"""
+    pass
+
+class DeadlineExceededError(CanvasAPIError):
+    """Error raised when the run deadline has passed"""
+    pass
+
 class DataProcessingError(CanvasAPIError):
     """Error related to processing data from Canvas API"""
     pass
@@ -0,0 +1,224 @@
+"""
+Typed loading of the grade CSVs
+Reads grades.csv-style history and notion_grades.csv with explicit dtypes (categorical
+names, float scores, datetime fetch times) instead of letting pandas re-infer them, and
+uses an optional Parquet mirror written next to each CSV when pyarrow is installed.
+Incremental notion_grades.csv files are read back as one row per student from the compact
+latest view written next to them (notion_grades.latest.csv), so readers never re-parse the
+growing history.
+"""
+
+import importlib.util
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from config import GRADES_PARQUET_MIRROR
+from utils.error_handler import logger
+
+# Parquet needs pyarrow; without it every load parses the CSV
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Long-format (grades.csv) columns
+GRADE_CATEGORY_COLUMNS = [
+    "student_name", "student_chinese_name", "student_english_name",
+    "course_name", "course_name_chinese", "grade"
+]
+
+# Wide-format (notion_grades.csv) columns that are not course scores
+NOTION_NAME_COLUMNS = ["student_name", "student_chinese_name", "student_english_name"]
+NOTION_METADATA_COLUMNS = NOTION_NAME_COLUMNS + ["Is Latest Batch", "Updated Time", "Update Batch"]
+
+def grade_dtypes(score_dtype: str = "float32") -> Dict[str, str]:
+    """Get the read_csv dtypes for grades.csv-style history"""
+    dtypes = {column: "category" for column in GRADE_CATEGORY_COLUMNS}
+    dtypes["score"] = score_dtype
+    return dtypes
+
+def sort_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sort the categories of categorical columns. read_csv can leave them in parse order
+    on large files, and groupby follows category order, so unsorted categories would
+    change the row order of everything built from the frame.
+    """
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and not df[column].cat.categories.is_monotonic_increasing:
+            df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    return df
+
+def coerce_grades(df: pd.DataFrame, score_dtype: str = "float32") -> pd.DataFrame:
+    """Apply the grades.csv dtypes to a frame built from text values (e.g. GradeStore rows)"""
+    df = df.replace("", np.nan)
+    df["score"] = pd.to_numeric(df["score"], errors="coerce").astype(score_dtype)
+    df["fetch_time"] = pd.to_datetime(df["fetch_time"])
+    for column in GRADE_CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+def mirror_path(csv_path: str) -> str:
+    """Get the Parquet mirror path for a CSV (grades.csv -> grades.parquet)"""
+    return f"{os.path.splitext(csv_path)[0]}.parquet"
+
+def _read_mirror(csv_path: str) -> Optional[pd.DataFrame]:
+    """Read the Parquet mirror if it is enabled and at least as new as the CSV"""
+    if not (GRADES_PARQUET_MIRROR and PARQUET_AVAILABLE):
+        return None
+    path = mirror_path(csv_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable Parquet mirror {path}: {str(e)}")
+        return None
+
+def write_mirror(df: pd.DataFrame, csv_path: str) -> None:
+    """Write (or refresh) the Parquet mirror next to a CSV; a no-op without pyarrow"""
+    if not (GRADES_PARQUET_MIRROR and PARQUET_AVAILABLE):
+        return
+    path = mirror_path(csv_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        logger.warning(f"Could not write Parquet mirror {path}: {str(e)}")
+
+def load_grades(csv_path: str, score_dtype: str = "float32") -> pd.DataFrame:
+    """
+    Load grades.csv-style history with categorical names, score_dtype scores
+    (NaN for N/A) and datetime fetch_time. Compressed (.csv.gz) files are read directly.
+    float32 keeps about 7 significant digits; pass "float64" when scores are written back out.
+    """
+    mirror_allowed = not csv_path.endswith(".gz")
+    df = _read_mirror(csv_path) if mirror_allowed else None
+    if df is None:
+        df = sort_categories(pd.read_csv(csv_path, dtype=grade_dtypes("float64"), parse_dates=["fetch_time"]))
+        if mirror_allowed:
+            write_mirror(df, csv_path)
+    # The mirror keeps float64 so any score dtype can be produced exactly
+    df["score"] = df["score"].astype(score_dtype)
+    return df
+
+def iter_grade_chunks(csv_path: str, chunksize: int, score_dtype: str = "float32") -> Iterator[pd.DataFrame]:
+    """Stream grades.csv-style history (plain or .csv.gz) as typed DataFrame chunks"""
+    for chunk in pd.read_csv(csv_path, dtype=grade_dtypes(score_dtype), parse_dates=["fetch_time"],
+                             chunksize=chunksize):
+        yield sort_categories(chunk)
+
+def reduce_latest(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Keep the running latest row per (student, course) across chunks, so memory
+    scales with the number of pairs instead of the history length. Later rows
+    win ties on fetch_time, as they would in one stable sort of the whole file.
+    """
+    latest = None
+    for chunk in chunks:
+        combined = chunk if latest is None else pd.concat([latest, chunk], ignore_index=True)
+        latest = combined.sort_values("fetch_time", kind="stable").drop_duplicates(
+            subset=["student_name", "course_name"],
+            keep="last"
+        )
+    return latest if latest is not None else pd.DataFrame()
+
+def notion_course_columns(df: pd.DataFrame) -> List[str]:
+    """Get the course score columns of a notion_grades.csv frame"""
+    return [column for column in df.columns if column not in NOTION_METADATA_COLUMNS]
+
+def latest_batch_path(csv_path: str) -> str:
+    """Get the latest-batch sidecar of an incremental notion_grades.csv (notion_grades.latest.json)"""
+    return f"{os.path.splitext(csv_path)[0]}.latest.json"
+
+def read_latest_batch(csv_path: str) -> Optional[Dict]:
+    """Read the latest-batch pointer: batch id, start_row, rows, total_rows and the file size after the write"""
+    path = latest_batch_path(csv_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable latest-batch pointer {path}: {str(e)}")
+        return None
+
+def write_latest_batch(csv_path: str, latest: Dict) -> None:
+    """Replace the latest-batch pointer atomically"""
+    path = latest_batch_path(csv_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".json.tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(latest, f, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def latest_view_path(csv_path: str) -> str:
+    """Get the one-row-per-student view of an incremental notion_grades.csv (notion_grades.latest.csv)"""
+    return f"{os.path.splitext(csv_path)[0]}.latest.csv"
+
+def write_latest_view(csv_path: str, df: pd.DataFrame) -> None:
+    """Replace the latest view atomically; written before the latest-batch pointer that validates it"""
+    path = latest_view_path(csv_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".csv.tmp")
+    os.close(fd)
+    try:
+        df.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _read_notion_csv(csv_path: str) -> pd.DataFrame:
+    """Parse a notion_grades.csv-style file with the wide-format dtypes"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {column: "category" for column in NOTION_NAME_COLUMNS if column in header}
+    dtypes.update({column: "float64" for column in header if column not in NOTION_METADATA_COLUMNS})
+    dtypes.update({column: "str" for column in ("Updated Time", "Update Batch") if column in header})
+    # "N/A" and empty cells are read as NaN
+    return sort_categories(pd.read_csv(csv_path, dtype=dtypes))
+
+def _apply_score_dtype(df: pd.DataFrame, score_dtype: str) -> pd.DataFrame:
+    course_columns = notion_course_columns(df)
+    if course_columns:
+        df[course_columns] = df[course_columns].astype(score_dtype)
+    return df
+
+def load_notion_history(csv_path: str, score_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Load every row of notion_grades.csv with categorical student names, score_dtype
+    course columns (NaN for N/A) and text batch metadata. Scores default to float64
+    because the consumers upload and format the exact decimal values.
+    """
+    df = _read_mirror(csv_path)
+    if df is None:
+        df = _read_notion_csv(csv_path)
+        write_mirror(df, csv_path)
+    return _apply_score_dtype(df, score_dtype)
+
+def load_notion_grades(csv_path: str, score_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Load notion_grades.csv as one row per student (the most recent) with an Is Latest
+    Batch column. Incremental files keep every batch, so the view is read from
+    notion_grades.latest.csv while the latest-batch pointer says it matches the file;
+    otherwise it is rebuilt from the whole history. Rewritten files already hold this view.
+    """
+    latest = read_latest_batch(csv_path)
+    view_path = latest_view_path(csv_path)
+    if latest is not None and os.path.exists(view_path) and latest.get("size") == os.path.getsize(csv_path):
+        return _apply_score_dtype(_read_notion_csv(view_path), score_dtype)
+
+    df = load_notion_history(csv_path, score_dtype)
+    if "Is Latest Batch" in df.columns or latest is None:
+        return df
+
+    df.insert(3, "Is Latest Batch", np.arange(len(df)) >= latest["start_row"])
+    return df[~df["student_name"].duplicated(keep="last")].reset_index(drop=True)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned grade history
+Writes grade records to gzip-compressed day partitions (data/grades/YYYY-MM-DD.csv.gz),
+compacts past months into YYYY-MM.csv.gz, and streams back only the partitions a reader needs.
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+
+# Add the parent directory to the path so the module can run as a script
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import GRADES_CSV_PATH, GRADES_HISTORY_LAYOUT, GRADES_PARTITION_DIR
+from utils.csv_handler import CSVHandler, GRADE_FIELDNAMES, file_lock
+from utils.error_handler import logger
+from utils.grade_loader import iter_grade_chunks
+
+PARTITION_SUFFIX = ".csv.gz"
+_DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+def list_partitions(base_dir: str) -> List[Tuple[str, str, str]]:
+    """List (first day, last day, path) for every day and month partition, oldest first"""
+    if not os.path.isdir(base_dir):
+        return []
+
+    partitions = []
+    for name in sorted(os.listdir(base_dir)):
+        if not name.endswith(PARTITION_SUFFIX):
+            continue
+        key = name[:-len(PARTITION_SUFFIX)]
+        if _DAY_PATTERN.match(key):
+            partitions.append((key, key, os.path.join(base_dir, name)))
+        elif _MONTH_PATTERN.match(key):
+            # Day strings compare correctly against "-31" even for shorter months
+            partitions.append((f"{key}-01", f"{key}-31", os.path.join(base_dir, name)))
+    return partitions
+
+def select_partitions(base_dir: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+    """Get the partition paths that can hold records fetched between since and until ("YYYY-MM-DD...")"""
+    return [
+        path for first_day, last_day, path in list_partitions(base_dir)
+        if (since is None or last_day >= since[:10]) and (until is None or first_day <= until[:10])
+    ]
+
+def iter_grade_records(base_dir: str, since: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Stream grade records fetched at or after since from the partitions that can hold them"""
+    for path in select_partitions(base_dir, since):
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                if since is None or record["fetch_time"] >= since:
+                    yield record
+
+def iter_grade_frames(base_dir: str, since: Optional[str] = None, chunksize: int = 100000,
+                      score_dtype: str = "float32") -> Iterator[pd.DataFrame]:
+    """Stream grade records fetched at or after since as typed DataFrame chunks (see utils/grade_loader.py)"""
+    for path in select_partitions(base_dir, since):
+        for chunk in iter_grade_chunks(path, chunksize, score_dtype):
+            if since is not None:
+                chunk = chunk[chunk['fetch_time'] >= pd.Timestamp(since)]
+            if not chunk.empty:
+                yield chunk
+
+class _PartitionWriter:
+    """Builds one partition's replacement in a temp file: the existing bytes plus a new gzip member"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_new = not (os.path.exists(path) and os.path.getsize(path) > 0)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        self.raw = os.fdopen(fd, 'wb')
+        if not self.is_new:
+            with open(path, 'rb') as existing:
+                shutil.copyfileobj(existing, self.raw)
+        # Concatenated gzip members read back as one stream
+        self.gz = gzip.GzipFile(fileobj=self.raw, mode='wb')
+        self.text = io.TextIOWrapper(self.gz, encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.text, fieldnames=GRADE_FIELDNAMES, extrasaction='ignore')
+        if self.is_new:
+            self.writer.writeheader()
+
+    def finish(self) -> None:
+        """Close the new member and swap the partition in atomically"""
+        self.text.flush()
+        self.text.detach()
+        self.gz.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        if self.is_new:
+            os.chmod(self.temp_path, 0o644)
+        else:
+            shutil.copymode(self.path, self.temp_path)
+        os.replace(self.temp_path, self.path)
+
+    def discard(self) -> None:
+        """Drop the temp file"""
+        self.raw.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def write_partitions(base_dir: str, records) -> Dict[str, int]:
+    """Append records to their day partitions; each partition is replaced atomically. Returns counts per day."""
+    os.makedirs(base_dir, exist_ok=True)
+    writers = {}
+    counts = {}
+    try:
+        for record in records:
+            day = str(record["fetch_time"])[:10]
+            if day not in writers:
+                writers[day] = _PartitionWriter(os.path.join(base_dir, f"{day}{PARTITION_SUFFIX}"))
+                counts[day] = 0
+            writers[day].writer.writerow(record)
+            counts[day] += 1
+        for writer in writers.values():
+            writer.finish()
+    except BaseException:
+        for writer in writers.values():
+            writer.discard()
+        raise
+    return counts
+
+class PartitionedCSVHandler(CSVHandler):
+    """CSVHandler that commits each run into day partitions under a directory instead of one grades.csv"""
+
+    def _ensure_directory(self) -> None:
+        """Ensure the partition directory exists"""
+        os.makedirs(self.file_path, exist_ok=True)
+
+    def save_grades(self, data: List[Dict[str, Any]], append: bool = True) -> None:
+        """Save grades data to the day partitions (buffered until commit() in buffered mode)"""
+        if not append:
+            raise ValueError("Partitioned grade history is append-only")
+        super().save_grades(data, append=True)
+
+    def _write_file(self, records: List[Dict[str, Any]], spill, append: bool) -> None:
+        """Write the committed records into their day partitions"""
+        write_partitions(self.file_path, self._iter_records(records, spill))
+
+def ensure_partitions(base_dir: str = GRADES_PARTITION_DIR, csv_path: str = GRADES_CSV_PATH) -> None:
+    """Split grades.csv into day partitions the first time the partitioned layout is used"""
+    if list_partitions(base_dir) or not os.path.exists(csv_path):
+        return
+    print(f"Moving the grade history in {csv_path} into day partitions under {base_dir}...")
+    logger.info(f"Importing {csv_path} into empty partition directory {base_dir}")
+    import_csv(csv_path, base_dir)
+
+def grade_history_path() -> str:
+    """
+    Path of the configured grade history: the partition directory (with grades.csv
+    moved into it on first use) or grades.csv
+    """
+    if GRADES_HISTORY_LAYOUT == "partitioned":
+        ensure_partitions()
+        return GRADES_PARTITION_DIR
+    return GRADES_CSV_PATH
+
+def create_grades_handler(grade_store=None) -> CSVHandler:
+    """Create the buffered grade history writer for the configured layout"""
+    if GRADES_HISTORY_LAYOUT == "partitioned":
+        ensure_partitions()
+        return PartitionedCSVHandler(GRADES_PARTITION_DIR, grade_store=grade_store, buffered=True)
+    return CSVHandler(GRADES_CSV_PATH, grade_store=grade_store, buffered=True)
+
+def compact_partitions(base_dir: str, before_month: Optional[str] = None) -> List[str]:
+    """
+    Merge the day partitions of every month before before_month ("YYYY-MM",
+    default: the current month) into one YYYY-MM.csv.gz. Records are keyed on
+    (student_name, course_name, fetch_time), so re-running an interrupted compaction
+    does not duplicate them. Returns the months compacted.
+    """
+    before_month = before_month or datetime.now().strftime("%Y-%m")
+    months = {}
+    for first_day, last_day, path in list_partitions(base_dir):
+        month = first_day[:7]
+        if first_day == last_day and month < before_month:
+            months.setdefault(month, []).append(path)
+
+    compacted = []
+    with file_lock(f"{base_dir.rstrip(os.sep)}.lock"):
+        for month, day_paths in sorted(months.items()):
+            month_path = os.path.join(base_dir, f"{month}{PARTITION_SUFFIX}")
+            sources = ([month_path] if os.path.exists(month_path) else []) + day_paths
+
+            fd, temp_path = tempfile.mkstemp(dir=base_dir, prefix=f".{month}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                        with io.TextIOWrapper(gz, encoding='utf-8', newline='') as text:
+                            writer = csv.DictWriter(text, fieldnames=GRADE_FIELDNAMES, extrasaction='ignore')
+                            writer.writeheader()
+                            rows = 0
+                            # A compaction that died after writing the month file but before removing
+                            # its day files leaves their rows in both; each record is written once
+                            seen = set()
+                            for source in sources:
+                                with gzip.open(source, 'rt', newline='', encoding='utf-8') as f:
+                                    for record in csv.DictReader(f):
+                                        key = (record.get("student_name"), record.get("course_name"), record.get("fetch_time"))
+                                        if key in seen:
+                                            continue
+                                        seen.add(key)
+                                        writer.writerow(record)
+                                        rows += 1
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, month_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            for path in day_paths:
+                os.remove(path)
+            compacted.append(month)
+            print(f"✅ Compacted {len(day_paths)} day partition(s) into {month_path} ({rows} records)")
+            logger.info(f"Compacted {len(day_paths)} day partitions into {month_path} ({rows} records)")
+    return compacted
+
+def import_csv(csv_path: str, base_dir: str) -> Dict[str, int]:
+    """One-time split of an existing grades.csv into day partitions"""
+    if not os.path.exists(csv_path):
+        print(f"⚠️ Input file {csv_path} does not exist.")
+        return {}
+    with file_lock(f"{base_dir.rstrip(os.sep)}.lock"):
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            counts = write_partitions(base_dir, csv.DictReader(f))
+    print(f"✅ Imported {sum(counts.values())} records from {csv_path} into {len(counts)} day partition(s) in {base_dir}")
+    return counts
+
+def main():
+    """Command line entry point for importing, compacting and listing grade partitions"""
+    parser = argparse.ArgumentParser(description="Manage the partitioned grade history")
+    parser.add_argument("--dir", default=GRADES_PARTITION_DIR, help="Partition directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Split an existing grades CSV into day partitions (one time)")
+    import_parser.add_argument("--csv", default=GRADES_CSV_PATH, help="Path to the grades CSV file")
+
+    compact_parser = subparsers.add_parser("compact", help="Merge day partitions of past months into monthly files")
+    compact_parser.add_argument("--before", help='Compact months before this one ("YYYY-MM", default: current month)')
+
+    subparsers.add_parser("list", help="List partitions")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        import_csv(args.csv, args.dir)
+    elif args.command == "compact":
+        compacted = compact_partitions(args.dir, args.before)
+        if not compacted:
+            print("Nothing to compact.")
+    elif args.command == "list":
+        for first_day, last_day, path in list_partitions(args.dir):
+            print(f"{first_day} .. {last_day}  {path}  ({os.path.getsize(path)} bytes)")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+SQLite grade history store
+Keeps the collected grade history, optionally as change-only intervals, and answers
+"latest grade per student and course" from a table maintained at write time.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Add the parent directory to the path so the module can run as a script
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import GRADES_CSV_PATH, GRADES_DB_PATH, GRADES_HISTORY_MODE
+from utils.error_handler import logger
+from utils.grade_partitions import iter_grade_records
+
+# Column order of grades.csv, shared by the importer and the exporter
+GRADE_FIELDS = [
+    "student_name", "student_chinese_name", "student_english_name",
+    "course_name", "course_name_chinese", "score", "grade", "fetch_time"
+]
+
+# Fields that make two records of the same student and course "unchanged"
+VALUE_FIELDS = ["student_chinese_name", "student_english_name", "course_name_chinese", "score", "grade"]
+
+class GradeStore:
+    """
+    Grade history in SQLite (WAL mode).
+
+    Every row covers an interval: it was fetched at fetch_time and still
+    unchanged at last_seen. In "changes" history mode a record identical to
+    the pair's row from the student's previous run only moves last_seen
+    forward; in "full" mode every record gets its own row. The observations
+    table logs each (student, fetch_time) run, so any past snapshot can be
+    rebuilt exactly in either mode.
+
+    Records are written in one transaction per batch, which also upserts the
+    latest_grades table, so latest() reads one row per (student, course)
+    whatever the history length. rebuild_latest() regenerates that table
+    from the history.
+
+    The store only holds the full history once the CSV history has been
+    imported (recorded in the meta table). With import_from, an empty store
+    imports it when opened, before anything else is written; has_history()
+    tells readers whether the store can stand in for the CSV files.
+    """
+
+    def __init__(self, db_path: str = GRADES_DB_PATH, history_mode: str = GRADES_HISTORY_MODE,
+                 import_from: Optional[str] = None):
+        if history_mode not in ("full", "changes"):
+            raise ValueError(f"Unknown grades history mode: {history_mode} (expected full or changes)")
+        self.db_path = db_path
+        self.history_mode = history_mode
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS grades (
+                id INTEGER PRIMARY KEY,
+                student_name TEXT NOT NULL,
+                student_chinese_name TEXT,
+                student_english_name TEXT,
+                course_name TEXT NOT NULL,
+                course_name_chinese TEXT,
+                score TEXT,
+                grade TEXT,
+                fetch_time TEXT NOT NULL,
+                last_seen TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_grades_student_course_time
+            ON grades (student_name, course_name, fetch_time)
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS observations (
+                student_name TEXT NOT NULL,
+                fetch_time TEXT NOT NULL,
+                PRIMARY KEY (student_name, fetch_time)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS latest_grades (
+                student_name TEXT NOT NULL,
+                student_chinese_name TEXT,
+                student_english_name TEXT,
+                course_name TEXT NOT NULL,
+                course_name_chinese TEXT,
+                score TEXT,
+                grade TEXT,
+                fetch_time TEXT NOT NULL,
+                grade_id INTEGER NOT NULL,
+                PRIMARY KEY (student_name, course_name)
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._migrate()
+        self.conn.commit()
+
+        if import_from is not None:
+            self.ensure_history(import_from)
+
+    def _migrate(self) -> None:
+        """Add the interval columns and run log to stores created before change-only history"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(grades)")]
+        if "last_seen" not in columns:
+            self.conn.execute("ALTER TABLE grades ADD COLUMN last_seen TEXT")
+        self.conn.execute("UPDATE grades SET last_seen = fetch_time WHERE last_seen IS NULL")
+
+        has_observations = self.conn.execute("SELECT 1 FROM observations LIMIT 1").fetchone()
+        if not has_observations:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO observations (student_name, fetch_time) "
+                "SELECT DISTINCT student_name, fetch_time FROM grades"
+            )
+
+        has_latest = self.conn.execute("SELECT 1 FROM latest_grades LIMIT 1").fetchone()
+        if not has_latest:
+            value_columns = ", ".join(field for field in GRADE_FIELDS if field != "fetch_time")
+            self._rebuild_latest(", ".join(GRADE_FIELDS), value_columns)
+
+    def close(self) -> None:
+        """Close the database connection"""
+        self.conn.close()
+
+    def import_record(self) -> Optional[Dict[str, Any]]:
+        """Get {"source", "rows", "imported_at"} of the CSV history import, or None before it"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'history_import'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _record_import(self, source: Optional[str], rows: int) -> None:
+        record = {"source": source, "rows": rows, "imported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('history_import', ?)",
+                              (json.dumps(record),))
+            self.conn.commit()
+
+    def clear_import_record(self) -> None:
+        """Forget the history import, so readers go back to the CSV history until the store is rebuilt"""
+        with self._lock:
+            self.conn.execute("DELETE FROM meta WHERE key = 'history_import'")
+            self.conn.commit()
+
+    def has_history(self) -> bool:
+        """Check if the store holds the whole grade history (the CSV history was imported into it)"""
+        return self.import_record() is not None
+
+    def ensure_history(self, csv_path: str) -> None:
+        """Import the CSV history into a new, empty store; a store that already has rows is left alone"""
+        if self.has_history():
+            return
+        if self.count():
+            print(f"ℹ️ {self.db_path} was filled without importing {csv_path}; reading the CSV history until "
+                  f"`python utils/grade_store.py import --replace` rebuilds it")
+            return
+        if os.path.exists(csv_path):
+            print(f"Importing grade history from {csv_path} into {self.db_path}...")
+            self.import_csv(csv_path)
+        else:
+            # No earlier history: the store holds everything from its first run
+            self._record_import(None, 0)
+
+    def count(self) -> int:
+        """Get the number of stored grade rows"""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+
+    def save_grades(self, records: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """
+        Save grade records in batched transactions and return the number of rows inserted.
+        Records are expected in fetch_time order per student, as collection produces them.
+        """
+        inserted = 0
+        batch = []
+        for record in records:
+            batch.append({field: self._to_text(record.get(field)) for field in GRADE_FIELDS})
+            if len(batch) >= batch_size:
+                inserted += self._save_batch(batch)
+                batch = []
+        if batch:
+            inserted += self._save_batch(batch)
+        return inserted
+
+    def _save_batch(self, batch: List[Dict[str, Optional[str]]]) -> int:
+        """Save one batch atomically"""
+        columns = ", ".join(GRADE_FIELDS + ["last_seen"])
+        placeholders = ", ".join("?" for _ in GRADE_FIELDS + ["last_seen"])
+        insert_sql = f"INSERT INTO grades ({columns}) VALUES ({placeholders})"
+
+        inserted = 0
+        previous_runs = {}
+        with self._lock:
+            with self.conn:
+                for record in batch:
+                    run = (record["student_name"], record["fetch_time"])
+                    if run not in previous_runs:
+                        previous_runs[run] = self.conn.execute(
+                            "SELECT MAX(fetch_time) FROM observations WHERE student_name = ? AND fetch_time < ?",
+                            run
+                        ).fetchone()[0]
+                        # Log the run before its records, since unchanged records add no row
+                        self.conn.execute(
+                            "INSERT OR IGNORE INTO observations (student_name, fetch_time) VALUES (?, ?)", run
+                        )
+
+                    grade_id = None
+                    if self.history_mode == "changes":
+                        grade_id = self._extend_unchanged(record, previous_runs[run])
+                    if grade_id is None:
+                        cursor = self.conn.execute(
+                            insert_sql, [record[field] for field in GRADE_FIELDS] + [record["fetch_time"]]
+                        )
+                        grade_id = cursor.lastrowid
+                        inserted += 1
+
+                    self._upsert_latest(record, grade_id)
+        return inserted
+
+    def _extend_unchanged(self, record: Dict[str, Optional[str]], previous_run: Optional[str]) -> Optional[int]:
+        """
+        Move last_seen forward if the pair is unchanged since the student's
+        previous run, and return the extended row's id (None if it changed).
+        """
+        if previous_run is None:
+            return None
+
+        row = self.conn.execute(
+            f"SELECT id, last_seen, {', '.join(VALUE_FIELDS)} FROM grades "
+            "WHERE student_name = ? AND course_name = ? ORDER BY fetch_time DESC, id DESC LIMIT 1",
+            (record["student_name"], record["course_name"])
+        ).fetchone()
+        # A pair missing from a run in between starts a new interval
+        if row is None or row[1] != previous_run or list(row[2:]) != [record[field] for field in VALUE_FIELDS]:
+            return None
+
+        self.conn.execute("UPDATE grades SET last_seen = ? WHERE id = ?", (record["fetch_time"], row[0]))
+        return row[0]
+
+    def _upsert_latest(self, record: Dict[str, Optional[str]], grade_id: int) -> None:
+        """Keep latest_grades pointing at the pair's newest record"""
+        columns = ", ".join(GRADE_FIELDS + ["grade_id"])
+        placeholders = ", ".join("?" for _ in GRADE_FIELDS + ["grade_id"])
+        updates = ", ".join(
+            f"{field} = excluded.{field}"
+            for field in GRADE_FIELDS + ["grade_id"] if field not in ("student_name", "course_name")
+        )
+        # Older records (e.g. an out-of-order import) never replace a newer one
+        self.conn.execute(
+            f"INSERT INTO latest_grades ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (student_name, course_name) DO UPDATE SET {updates} "
+            "WHERE excluded.fetch_time >= latest_grades.fetch_time",
+            [record[field] for field in GRADE_FIELDS] + [grade_id]
+        )
+
+    def _to_text(self, value: Any) -> str:
+        """Store values as the text grades.csv would hold"""
+        if value is None:
+            return ""
+        return str(value)
+
+    def latest(self) -> List[Dict[str, Any]]:
+        """Get the newest record for each (student, course), as last seen, ordered by fetch time"""
+        columns = ", ".join(GRADE_FIELDS)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {columns} FROM latest_grades ORDER BY fetch_time, grade_id"
+            ).fetchall()
+        return [dict(zip(GRADE_FIELDS, row)) for row in rows]
+
+    def rebuild_latest(self) -> int:
+        """Rebuild latest_grades from the history and return the number of (student, course) pairs"""
+        columns = ", ".join(GRADE_FIELDS)
+        value_columns = ", ".join(field for field in GRADE_FIELDS if field != "fetch_time")
+        with self._lock:
+            with self.conn:
+                self._rebuild_latest(columns, value_columns)
+            pairs = self.conn.execute("SELECT COUNT(*) FROM latest_grades").fetchone()[0]
+        print(f"✅ Rebuilt latest grades for {pairs} student/course pairs in {self.db_path}")
+        return pairs
+
+    def _rebuild_latest(self, columns: str, value_columns: str) -> None:
+        """Replace latest_grades with each pair's newest history row (caller holds the transaction)"""
+        self.conn.execute("DELETE FROM latest_grades")
+        # SQLite returns the bare columns from the row holding MAX(fetch_time),
+        # and the grouping is served by the (student, course, fetch_time) index
+        self.conn.execute(f"""
+            INSERT INTO latest_grades ({columns}, grade_id)
+            SELECT {value_columns}, last_seen, id FROM (
+                SELECT {columns}, last_seen, id, MAX(fetch_time)
+                FROM grades
+                GROUP BY student_name, course_name
+            )
+        """)
+
+    def snapshot(self, at: str) -> List[Dict[str, Any]]:
+        """
+        Rebuild the records of each student's most recent run at or before `at`
+        ("YYYY-MM-DD HH:MM:SS"), exactly as they were collected.
+        """
+        value_columns = ", ".join(f"g.{field}" for field in GRADE_FIELDS if field != "fetch_time")
+        sql = f"""
+            SELECT {value_columns}, runs.fetch_time
+            FROM (
+                SELECT student_name, MAX(fetch_time) AS fetch_time
+                FROM observations
+                WHERE fetch_time <= ?
+                GROUP BY student_name
+            ) runs
+            JOIN grades g
+              ON g.student_name = runs.student_name
+             AND g.fetch_time <= runs.fetch_time
+             AND g.last_seen >= runs.fetch_time
+            ORDER BY runs.fetch_time, g.id
+        """
+        with self._lock:
+            rows = self.conn.execute(sql, (at,)).fetchall()
+        return [dict(zip(GRADE_FIELDS, self._blank_nulls(row))) for row in rows]
+
+    def iter_history(self, expand: bool = False, batch_size: int = 5000) -> Iterable[Dict[str, Any]]:
+        """
+        Yield stored rows in insertion order, or with expand=True every
+        collected record (one per run, as a full grades.csv would hold them).
+        """
+        if not expand:
+            columns = ", ".join(GRADE_FIELDS)
+            last_id = 0
+            while True:
+                with self._lock:
+                    rows = self.conn.execute(
+                        f"SELECT id, {columns} FROM grades WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, batch_size)
+                    ).fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(GRADE_FIELDS, self._blank_nulls(row[1:])))
+                last_id = rows[-1][0]
+
+        value_columns = ", ".join(f"g.{field}" for field in GRADE_FIELDS if field != "fetch_time")
+        with self._lock:
+            runs = self.conn.execute(
+                "SELECT student_name, fetch_time FROM observations ORDER BY fetch_time, rowid"
+            ).fetchall()
+        for student_name, fetch_time in runs:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT {value_columns}, ? FROM grades g "
+                    "WHERE g.student_name = ? AND g.fetch_time <= ? AND g.last_seen >= ? ORDER BY g.id",
+                    (fetch_time, student_name, fetch_time, fetch_time)
+                ).fetchall()
+            for row in rows:
+                yield dict(zip(GRADE_FIELDS, self._blank_nulls(row)))
+
+    def _blank_nulls(self, row) -> List[Any]:
+        """Turn NULLs into the empty strings grades.csv holds"""
+        return ["" if value is None else value for value in row]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get stored row counts against the number of records collected"""
+        with self._lock:
+            rows = self.conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+            runs = self.conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+            records = self.conn.execute("""
+                SELECT COUNT(*) FROM observations o
+                JOIN grades g
+                  ON g.student_name = o.student_name
+                 AND g.fetch_time <= o.fetch_time
+                 AND g.last_seen >= o.fetch_time
+            """).fetchone()[0]
+        return {
+            "rows": rows,
+            "runs": runs,
+            "records": records,
+            "saved_ratio": round(1 - rows / records, 3) if records else 0.0
+        }
+
+    def compact(self) -> Dict[str, Any]:
+        """Rewrite the store as change-only history and return the new stats"""
+        compact_path = f"{self.db_path}.compact"
+        for path in (compact_path, f"{compact_path}-wal", f"{compact_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        compacted = GradeStore(compact_path, history_mode="changes")
+        compacted.save_grades(self.iter_history(expand=True), batch_size=5000)
+        record = self.import_record()
+        if record is not None:
+            compacted._record_import(record["source"], record["rows"])
+        compacted.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        compacted.close()
+
+        # Swap the compacted database in place of this one
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+            os.replace(compact_path, self.db_path)
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(f"{compact_path}{suffix}"):
+                    os.remove(f"{compact_path}{suffix}")
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        stats = self.stats()
+        print(f"✅ Compacted {self.db_path}: {stats['rows']} rows for {stats['records']} records "
+              f"({stats['saved_ratio']:.1%} saved)")
+        return stats
+
+    def import_csv(self, csv_path: str, force: bool = False, replace: bool = False) -> int:
+        """
+        One-time import of an existing grades.csv or partition directory; refuses to import into a
+        non-empty store unless forced, or replace clears the store first (the CSV history holds every run).
+        """
+        if not os.path.exists(csv_path):
+            print(f"⚠️ Input file {csv_path} does not exist.")
+            return 0
+        if replace:
+            with self._lock:
+                for table in ("grades", "observations", "latest_grades", "meta"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.commit()
+        elif self.count() and not force:
+            print(f"⚠️ {self.db_path} already holds grades; use --replace to rebuild it from {csv_path}")
+            return 0
+
+        if os.path.isdir(csv_path):
+            # A directory of day/month partitions
+            imported = self.save_grades(iter_grade_records(csv_path), batch_size=5000)
+        else:
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                imported = self.save_grades(csv.DictReader(f), batch_size=5000)
+        self._record_import(csv_path, imported)
+
+        print(f"✅ Imported {csv_path} into {self.db_path} ({imported} rows stored, {self.history_mode} history)")
+        logger.info(f"Imported {csv_path} into {self.db_path} ({imported} rows stored, {self.history_mode} history)")
+        return imported
+
+    def export_csv(self, csv_path: str, expand: bool = False) -> int:
+        """Write the stored rows, or with expand=True every collected record, to a grades.csv-compatible file"""
+        directory = os.path.dirname(csv_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        exported = 0
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=GRADE_FIELDS)
+            writer.writeheader()
+            for record in self.iter_history(expand=expand):
+                writer.writerow(record)
+                exported += 1
+
+        print(f"✅ Exported {exported} records from {self.db_path} to {csv_path}")
+        return exported
+
+def main():
+    """Command line entry point for importing, exporting and inspecting the grade store"""
+    parser = argparse.ArgumentParser(description="Manage the SQLite grade history store")
+    parser.add_argument("--db", default=GRADES_DB_PATH, help="Path to the grades database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import an existing grades CSV (one time)")
+    import_parser.add_argument("--csv", default=GRADES_CSV_PATH, help="Path to the grades CSV file or partition directory")
+    import_parser.add_argument("--force", action="store_true", help="Import even if the store already holds grades")
+    import_parser.add_argument("--replace", action="store_true", help="Clear the store, then import")
+
+    export_parser = subparsers.add_parser("export", help="Export the history as a grades CSV")
+    export_parser.add_argument("--csv", default=GRADES_CSV_PATH, help="Path to the output CSV file")
+    export_parser.add_argument("--expand", action="store_true", help="Write one row per collected record, as a full grades.csv")
+
+    subparsers.add_parser("latest", help="Print the latest grade per student and course")
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Print the grades as collected at a past time")
+    snapshot_parser.add_argument("--at", required=True, help='Point in time, e.g. "2025-04-01 12:00:00"')
+
+    subparsers.add_parser("rebuild-latest", help="Rebuild the latest grades table from the history")
+    subparsers.add_parser("stats", help="Print stored rows against collected records")
+    subparsers.add_parser("compact", help="Rewrite the store as change-only history")
+
+    args = parser.parse_args()
+    store = GradeStore(args.db)
+    try:
+        if args.command == "import":
+            store.import_csv(args.csv, force=args.force, replace=args.replace)
+        elif args.command == "export":
+            store.export_csv(args.csv, expand=args.expand)
+        elif args.command in ("latest", "snapshot"):
+            writer = csv.DictWriter(sys.stdout, fieldnames=GRADE_FIELDS)
+            writer.writeheader()
+            writer.writerows(store.latest() if args.command == "latest" else store.snapshot(args.at))
+        elif args.command == "stats":
+            stats = store.stats()
+            print(f"{stats['rows']} rows for {stats['records']} collected records over {stats['runs']} student runs "
+                  f"({stats['saved_ratio']:.1%} saved)")
+        elif args.command == "rebuild-latest":
+            store.rebuild_latest()
+        elif args.command == "compact":
+            store.compact()
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
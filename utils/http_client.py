@@ -0,0 +1,179 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Iterator, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_MAXSIZE, CANVAS_PER_PAGE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from utils.rate_limiter import get_rate_limiter
+from utils.retry import RetryPolicy, DEFAULT_RETRY_POLICY, get_circuit_breaker
+from utils.error_handler import logger, DeadlineExceededError
+from utils.response_cache import get_response_cache
+
+# One keep-alive session per Canvas domain, shared by all collectors
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# Monotonic time after which no new Canvas request is started
+_run_deadline: Optional[float] = None
+
+def _create_session() -> requests.Session:
+    """Create a session with a connection pool sized for concurrent collection"""
+    session = requests.Session()
+
+    # Block instead of opening throwaway connections when the pool is exhausted
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    # Students share a session, so never carry cookies from one token to another
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+def get_session(domain: str) -> requests.Session:
+    """Get the shared session for a Canvas domain, creating it on first use"""
+    with _sessions_lock:
+        session = _sessions.get(domain)
+        if session is None:
+            session = _create_session()
+            _sessions[domain] = session
+        return session
+
+def set_run_deadline(seconds: Optional[float]) -> None:
+    """Set the run deadline in seconds from now (None or 0 to clear it)"""
+    global _run_deadline
+    _run_deadline = time.monotonic() + seconds if seconds else None
+
+def _request_timeout() -> Tuple[float, float]:
+    """Get (connect, read) timeouts, capped to the time left before the run deadline"""
+    if _run_deadline is None:
+        return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+    remaining = _run_deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceededError("Run deadline exceeded, request not started")
+    return min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining)
+
+def canvas_get(domain: str, url: str, headers: Optional[Dict] = None, params: Optional[Dict] = None,
+               retry_policy: Optional[RetryPolicy] = None) -> requests.Response:
+    """
+    Make a GET request to Canvas through the domain's shared session.
+    Endpoints listed in CANVAS_CACHE_TTLS are served from the on-disk response cache
+    while fresh and revalidated with ETag/Last-Modified once stale.
+    """
+    cache = get_response_cache()
+    ttl = cache.get_ttl(url) if cache else None
+    if ttl is None:
+        return _get_with_retries(domain, url, headers, params, retry_policy)
+
+    key = cache.make_key(url, params, headers)
+    entry = cache.lookup(key)
+    if entry and cache.is_fresh(entry, ttl):
+        cache.record("hits")
+        return cache.to_response(entry)
+
+    request_headers = dict(headers or {})
+    if entry:
+        request_headers.update(cache.conditional_headers(entry))
+
+    response = _get_with_retries(domain, url, request_headers, params, retry_policy)
+
+    if response.status_code == 304 and entry:
+        cache.touch(key)
+        cache.record("revalidated")
+        return cache.to_response(entry)
+
+    cache.record("misses")
+    if response.status_code == 200:
+        cache.store(key, response)
+    return response
+
+def canvas_post(domain: str, url: str, headers: Optional[Dict] = None, json: Optional[Dict] = None,
+                idempotent: bool = False, retry_policy: Optional[RetryPolicy] = None) -> requests.Response:
+    """
+    Make a POST request to Canvas through the domain's shared session.
+    Only retried when the caller marks it idempotent (e.g. a read-only GraphQL query).
+    """
+    if not idempotent:
+        retry_policy = RetryPolicy(max_attempts=1)
+    return _request_with_retries("POST", domain, url, headers, retry_policy, json=json)
+
+def _get_with_retries(domain: str, url: str, headers: Optional[Dict], params: Optional[Dict],
+                      retry_policy: Optional[RetryPolicy]) -> requests.Response:
+    """Send a GET request with retries"""
+    return _request_with_retries("GET", domain, url, headers, retry_policy, params=params)
+
+def _request_with_retries(method: str, domain: str, url: str, headers: Optional[Dict],
+                          retry_policy: Optional[RetryPolicy], **kwargs) -> requests.Response:
+    """
+    Send a request, paced by the token's rate limiter, with HTTP_CONNECT_TIMEOUT /
+    HTTP_READ_TIMEOUT timeouts and transient failures retried with backoff. CircuitOpenError is
+    raised while the domain is known to be down, DeadlineExceededError once the run deadline passes.
+    """
+    policy = retry_policy or DEFAULT_RETRY_POLICY
+    breaker = get_circuit_breaker(domain)
+    limiter = get_rate_limiter(domain, (headers or {}).get("Authorization", ""))
+
+    attempt = 0
+    while True:
+        timeout = _request_timeout()
+        # Budget first: a half-open probe must only be let through once it will really be sent
+        limiter.acquire(_run_deadline)
+        try:
+            breaker.before_request()
+        except BaseException:
+            limiter.release()
+            raise
+
+        response = None
+        try:
+            response = get_session(domain).request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            if attempt + 1 >= policy.max_attempts:
+                raise
+            reason = str(e)
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if attempt + 1 >= policy.max_attempts or not policy.should_retry(response):
+                return response
+            reason = f"status {response.status_code}"
+        finally:
+            limiter.release(response)
+
+        delay = policy.get_delay(attempt, response)
+        if delay is None:
+            # Retry-After is longer than we are willing to wait
+            return response
+
+        if _run_deadline is not None and time.monotonic() + delay >= _run_deadline:
+            raise DeadlineExceededError(f"Run deadline exceeded while retrying {url}")
+
+        attempt += 1
+        print(f"⚠️ {reason} for {url}, retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+        logger.warning(f"Retrying {url} after {reason} (attempt {attempt + 1}/{policy.max_attempts})")
+        time.sleep(delay)
+
+def iter_canvas_items(domain: str, url: str, headers: Optional[Dict] = None,
+                      params: Optional[Dict] = None, per_page: int = CANVAS_PER_PAGE) -> Iterator[Any]:
+    """
+    Yield items from a paginated Canvas list endpoint as each page arrives.
+    Follows the Link rel="next" header and raises requests.HTTPError on a failed page.
+    """
+    params = dict(params or {})
+    params.setdefault("per_page", per_page)
+
+    while url:
+        response = canvas_get(domain, url, headers=headers, params=params)
+        response.raise_for_status()
+
+        for item in response.json():
+            yield item
+
+        # The next link already carries every query parameter
+        url = response.links.get("next", {}).get("url")
+        params = None
@@ -0,0 +1,149 @@
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+import requests
+from utils.error_handler import DeadlineExceededError
+from config import (
+    CANVAS_RATE_LIMIT_CAPACITY,
+    CANVAS_RATE_LIMIT_LEAK_RATE,
+    CANVAS_RATE_LIMIT_RESERVE
+)
+
+# Canvas charges every request this much up front and refunds it when it completes
+PREFLIGHT_COST = 50.0
+
+class CanvasRateLimiter:
+    """
+    Adaptive leaky-bucket limiter for one Canvas API token on one domain.
+
+    The local budget is resynchronised from X-Rate-Limit-Remaining on every
+    response, and X-Request-Cost feeds a running estimate of what an in-flight
+    request will cost. Requests wait only when the budget left after all
+    in-flight requests would drop below the configured reserve.
+    """
+
+    def __init__(self, label: str, capacity: float = CANVAS_RATE_LIMIT_CAPACITY,
+                 leak_rate: float = CANVAS_RATE_LIMIT_LEAK_RATE, reserve: float = CANVAS_RATE_LIMIT_RESERVE):
+        self.label = label
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.reserve = reserve
+        self.remaining = capacity
+        self.cost_estimate = PREFLIGHT_COST
+        self.in_flight = 0
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+        # Metrics
+        self.requests = 0
+        self.throttled = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self) -> None:
+        """Credit the budget the bucket has leaked since the last update"""
+        now = time.monotonic()
+        self.remaining = min(self.capacity, self.remaining + (now - self._updated) * self.leak_rate)
+        self._updated = now
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """
+        Block until there is budget for one more request. Returns the time waited in seconds.
+        Raises DeadlineExceededError when the budget would only come back after deadline
+        (a time.monotonic() value).
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                self._refill()
+                # A high X-Request-Cost estimate must not ask for more than the bucket can hold
+                needed = min(self.capacity, self.reserve + (self.in_flight + 1) * self.cost_estimate)
+                deficit = needed - self.remaining
+                if deficit <= 0:
+                    break
+                wait = deficit / self.leak_rate
+                if deadline is not None and time.monotonic() + wait >= deadline:
+                    raise DeadlineExceededError(f"Run deadline exceeded waiting for {self.label} rate limit budget")
+                self._condition.wait(timeout=wait)
+
+            self.in_flight += 1
+            self.requests += 1
+
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                self.waits += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            return waited
+
+    def release(self, response: Optional[requests.Response] = None) -> None:
+        """Record a finished request and resynchronise the budget from its headers"""
+        with self._condition:
+            self.in_flight -= 1
+            self._refill()
+
+            if response is not None:
+                remaining = _header_float(response, "X-Rate-Limit-Remaining")
+                if remaining is not None:
+                    self.remaining = remaining
+                    self._updated = time.monotonic()
+
+                cost = _header_float(response, "X-Request-Cost")
+                if cost is not None:
+                    # In-flight requests always hold at least the pre-flight charge
+                    self.cost_estimate = max(PREFLIGHT_COST, 0.8 * self.cost_estimate + 0.2 * cost)
+
+                if is_throttled(response):
+                    self.throttled += 1
+                    self.remaining = 0.0
+                    self._updated = time.monotonic()
+
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Current budget and wait statistics"""
+        with self._condition:
+            self._refill()
+            return {
+                "remaining": round(self.remaining, 1),
+                "cost_estimate": round(self.cost_estimate, 1),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "waits": self.waits,
+                "total_wait": round(self.total_wait, 3),
+                "max_wait": round(self.max_wait, 3)
+            }
+
+def _header_float(response: requests.Response, name: str) -> Optional[float]:
+    """Read a numeric header, ignoring missing or malformed values"""
+    try:
+        return float(response.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def is_throttled(response: requests.Response) -> bool:
+    """Check if Canvas rejected a request for exceeding the token's rate limit"""
+    return response.status_code == 403 and "Rate Limit Exceeded" in response.text
+
+# One limiter per (domain, token)
+_limiters: Dict[Tuple[str, str], CanvasRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(domain: str, token: str) -> CanvasRateLimiter:
+    """Get the shared limiter for a token on a Canvas domain"""
+    with _limiters_lock:
+        limiter = _limiters.get((domain, token))
+        if limiter is None:
+            # Never expose the token itself in metrics or logs
+            label = f"{domain} (token ...{token[-4:]})" if token else domain
+            limiter = CanvasRateLimiter(label)
+            _limiters[(domain, token)] = limiter
+        return limiter
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, Any]]:
+    """Get current metrics for every limiter, keyed by label"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.label: limiter.metrics() for limiter in limiters}
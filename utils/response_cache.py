@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+from config import HTTP_CACHE_ENABLED, HTTP_CACHE_PATH, CANVAS_CACHE_TTLS
+from utils.error_handler import logger
+
+# Headers kept with a cached response (Link is needed to keep paginating)
+_STORED_HEADERS = ("Content-Type", "Link", "ETag", "Last-Modified")
+
+class ResponseCache:
+    """
+    On-disk cache of Canvas GET responses with per-endpoint TTLs.
+
+    Fresh entries are returned without a request. Stale entries are revalidated
+    with If-None-Match / If-Modified-Since so a 304 reuses the stored body.
+    Entries are keyed by token and full URL, since every response is per student.
+    """
+
+    def __init__(self, db_path: str = HTTP_CACHE_PATH, ttls: Optional[Dict[str, float]] = None):
+        self.db_path = db_path
+        self.ttls = CANVAS_CACHE_TTLS if ttls is None else ttls
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get_ttl(self, url: str) -> Optional[float]:
+        """Get the TTL for a URL's endpoint, or None if the endpoint is not cached"""
+        path = urlparse(url).path
+        endpoint = path.split("/api/v1/", 1)[1] if "/api/v1/" in path else path.lstrip("/")
+        segments = endpoint.rstrip("/").split("/")
+
+        # Patterns may use * for a single path segment, e.g. "courses/*"
+        for pattern, ttl in self.ttls.items():
+            pattern_segments = pattern.split("/")
+            if len(pattern_segments) == len(segments) and all(
+                expected in ("*", actual) for expected, actual in zip(pattern_segments, segments)
+            ):
+                return ttl
+        return None
+
+    def make_key(self, url: str, params: Optional[Dict], headers: Optional[Dict]) -> str:
+        """Build a cache key from the token and the fully encoded URL"""
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        token = (headers or {}).get("Authorization", "")
+        return hashlib.sha256(f"{token}\n{full_url}".encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a stored entry by key"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT url, headers, body, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"url": row[0], "headers": json.loads(row[1]), "body": row[2], "stored_at": row[3]}
+
+    def is_fresh(self, entry: Dict[str, Any], ttl: float) -> bool:
+        """Check if an entry can be used without revalidation"""
+        return time.time() - entry["stored_at"] < ttl
+
+    def conditional_headers(self, entry: Dict[str, Any]) -> Dict[str, str]:
+        """Get the revalidation headers for a stale entry"""
+        conditional = {}
+        if entry["headers"].get("ETag"):
+            conditional["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            conditional["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return conditional
+
+    def store(self, key: str, response: requests.Response) -> None:
+        """Store a successful response"""
+        headers = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, url, headers, body, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, response.url, json.dumps(headers), response.content, time.time())
+                )
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cache response for {response.url}: {str(e)}")
+
+    def touch(self, key: str) -> None:
+        """Mark a revalidated entry as fresh again"""
+        with self._lock:
+            self.conn.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+
+    def to_response(self, entry: Dict[str, Any]) -> requests.Response:
+        """Rebuild a requests.Response from a stored entry"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"]
+        response.encoding = "utf-8"
+        return response
+
+    def record(self, outcome: str) -> None:
+        """Count a hit, revalidation or miss"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counts and ratios for this run"""
+        with self._lock:
+            total = self.hits + self.revalidated + self.misses
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.revalidated) / total, 3) if total else 0.0,
+                "miss_ratio": round(self.misses / total, 3) if total else 0.0
+            }
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the shared response cache, or None if caching is disabled"""
+    global _cache
+    if not HTTP_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
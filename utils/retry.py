@@ -0,0 +1,124 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+import requests
+from config import (
+    CANVAS_RETRY_MAX_ATTEMPTS,
+    CANVAS_RETRY_BASE_DELAY,
+    CANVAS_RETRY_MAX_DELAY,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_TIMEOUT
+)
+from utils.error_handler import logger, CircuitOpenError
+from utils.rate_limiter import is_throttled
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for idempotent requests"""
+
+    def __init__(self, max_attempts: int = CANVAS_RETRY_MAX_ATTEMPTS, base_delay: float = CANVAS_RETRY_BASE_DELAY,
+                 max_delay: float = CANVAS_RETRY_MAX_DELAY, retry_statuses: Iterable[int] = (429, 500, 502, 503, 504)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def should_retry(self, response: requests.Response) -> bool:
+        """Check if a response is a transient failure worth retrying"""
+        return response.status_code in self.retry_statuses or is_throttled(response)
+
+    def get_delay(self, attempt: int, response: Optional[requests.Response] = None) -> Optional[float]:
+        """
+        Get the delay before the next attempt (attempt counts from 0).
+        Returns None when the server asks us to wait longer than max_delay.
+        """
+        retry_after = _parse_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+def _parse_retry_after(response: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Fail fast for a Canvas domain that keeps failing.
+
+    After failure_threshold consecutive connection errors or 5xx responses the
+    circuit opens and requests raise CircuitOpenError. Once reset_timeout has
+    passed a single probe request is let through; its outcome closes the
+    circuit again or re-opens it for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, domain: str, failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.domain = domain
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let exactly one probe through
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit for {self.domain} half-open, probing")
+                return
+            raise CircuitOpenError(f"Circuit open for {self.domain}, skipping request")
+
+    def record_success(self) -> None:
+        """Close the circuit after a healthy response"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.domain} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit at the threshold or after a failed probe"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.domain} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+# One breaker per Canvas domain
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(domain: str) -> CircuitBreaker:
+    """Get the shared circuit breaker for a Canvas domain"""
+    with _breakers_lock:
+        breaker = _breakers.get(domain)
+        if breaker is None:
+            breaker = CircuitBreaker(domain)
+            _breakers[domain] = breaker
+        return breaker
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -0,0 +1,170 @@
+"""
+Student identity index
+Maps every form a student's name shows up in (credentials key, Canvas name, English
+name, English first name, "English Last" and STUDENT_NAME_ALIASES) to one canonical
+student, ignoring case and whitespace. The index is built once per run and cached on
+disk, keyed by a hash of credentials.json and the aliases; the cache holds names only.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+from config import CREDENTIALS_FILE, STUDENT_CREDENTIALS, STUDENT_INDEX_CACHE_PATH, STUDENT_NAME_ALIASES
+from utils.error_handler import logger
+
+# Bump when the index layout or name derivation changes
+INDEX_VERSION = 1
+
+# Name forms taken from credentials win over forms derived from them (first names,
+# "English Last"), so a shared first name never hides another student's full name
+_EXACT, _DERIVED = 0, 1
+
+_index = None
+_index_lock = threading.Lock()
+
+def normalize_name(name) -> str:
+    """Normalize a name for lookups: trimmed, single-spaced and case-folded"""
+    if not isinstance(name, str):
+        return ""
+    return " ".join(name.split()).casefold()
+
+class StudentIndex:
+    """O(1) lookups from any known name form to the canonical student"""
+
+    def __init__(self, students: Dict[str, Dict[str, str]], names: Dict[str, str]):
+        # Credentials key -> {"student_name", "chinese_name", "english_name"}
+        self.students = students
+        # Normalized name form -> credentials key
+        self.names = names
+
+    @classmethod
+    def build(cls, credentials: Dict[str, Dict], aliases: Dict[str, str]) -> "StudentIndex":
+        """Build the index from credentials.json entries and the configured aliases"""
+        students = {}
+        # Normalized form -> (priority, credentials keys claiming it at that priority)
+        candidates = {}
+
+        def add(form: str, key: str, priority: int) -> None:
+            form = normalize_name(form)
+            if not form:
+                return
+            best_priority, keys = candidates.get(form, (priority, set()))
+            if priority < best_priority:
+                keys = set()
+            elif priority > best_priority:
+                return
+            keys.add(key)
+            candidates[form] = (priority, keys)
+
+        for key, data in credentials.items():
+            canvas_name = data.get("student_name") or key
+            english_name = data.get("student_english_name", "") or ""
+            students[key] = {
+                "student_name": canvas_name,
+                "chinese_name": data.get("student_chinese_name", "") or "",
+                "english_name": english_name
+            }
+
+            add(key, key, _EXACT)
+            add(canvas_name, key, _EXACT)
+            add(english_name, key, _EXACT)
+
+            # Typical Canvas forms: the English first name alone, or with the Canvas last name
+            english_first_name = english_name.split()[0] if english_name.split() else ""
+            add(english_first_name, key, _DERIVED)
+            if english_first_name and len(canvas_name.split()) > 1:
+                add(f"{english_first_name} {canvas_name.split()[-1]}", key, _DERIVED)
+
+        names = {}
+        for form, (priority, keys) in candidates.items():
+            if len(keys) == 1:
+                names[form] = next(iter(keys))
+            else:
+                logger.warning(f"Student name '{form}' matches {len(keys)} students; add an alias to pick one")
+
+        # Aliases are explicit, so they override anything derived above
+        for alias, target in aliases.items():
+            key = names.get(normalize_name(target))
+            if key is None:
+                logger.info(f"Student alias '{alias}' points to unknown student '{target}'")
+                continue
+            names[normalize_name(alias)] = key
+
+        return cls(students, names)
+
+    def lookup(self, name) -> Optional[Dict[str, str]]:
+        """Get the canonical student for any known name form, or None"""
+        key = self.names.get(normalize_name(name))
+        return self.students[key] if key is not None else None
+
+    def canonical_name(self, name) -> str:
+        """Get the student's Canvas name from credentials, or the name itself when unknown"""
+        student = self.lookup(name)
+        if student is not None:
+            return student["student_name"]
+        return " ".join(name.split()) if isinstance(name, str) else ""
+
+    def chinese_name(self, name) -> str:
+        """Get the student's Chinese name ("" when unknown)"""
+        student = self.lookup(name)
+        return student["chinese_name"] if student is not None else ""
+
+    def english_name(self, name) -> str:
+        """Get the student's preferred English name ("" when unknown)"""
+        student = self.lookup(name)
+        return student["english_name"] if student is not None else ""
+
+    def match_names(self, names: Iterable[str], reference: Iterable[str]) -> Dict[str, str]:
+        """Map each name to the reference name of the same student (names without a match map to themselves)"""
+        by_identity = {self.canonical_name(name): name for name in reference}
+        return {name: by_identity.get(self.canonical_name(name), name) for name in names}
+
+def _source_key() -> str:
+    """Hash of everything the index is built from"""
+    digest = hashlib.sha256(f"v{INDEX_VERSION}\n".encode("utf-8"))
+    if os.path.exists(CREDENTIALS_FILE):
+        with open(CREDENTIALS_FILE, 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps(STUDENT_NAME_ALIASES, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _load_cache(source_key: str) -> Optional[StudentIndex]:
+    """Load the cached index if it was built from the current credentials and aliases"""
+    if not os.path.exists(STUDENT_INDEX_CACHE_PATH):
+        return None
+    try:
+        with open(STUDENT_INDEX_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable student index {STUDENT_INDEX_CACHE_PATH}: {str(e)}")
+        return None
+    if cache.get("source_key") != source_key:
+        return None
+    return StudentIndex(cache["students"], cache["names"])
+
+def _save_cache(index: StudentIndex, source_key: str) -> None:
+    """Save the index to disk"""
+    directory = os.path.dirname(STUDENT_INDEX_CACHE_PATH)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    try:
+        with open(STUDENT_INDEX_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({"source_key": source_key, "students": index.students, "names": index.names},
+                      f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not write student index {STUDENT_INDEX_CACHE_PATH}: {str(e)}")
+
+def get_student_index() -> StudentIndex:
+    """Get the run's student index, loading it from the disk cache or building it once"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            source_key = _source_key()
+            _index = _load_cache(source_key)
+            if _index is None:
+                _index = StudentIndex.build(STUDENT_CREDENTIALS, STUDENT_NAME_ALIASES)
+                _save_cache(_index, source_key)
+                logger.info(f"Built student index: {len(_index.students)} students, {len(_index.names)} name forms")
+        return _index
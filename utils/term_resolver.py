@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from config import CANVAS_TERM_IDS, CANVAS_TERM_CACHE_PATH, CANVAS_TERM_CACHE_TTL, CANVAS_TERM_GRACE_DAYS
+from utils.error_handler import logger, DeadlineExceededError
+from utils.http_client import iter_canvas_items
+
+# Resolved term ids per student (domain and token), kept for the run
+_resolved: Dict[str, List[int]] = {}
+_student_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+def _load_cache() -> Dict:
+    """Load resolved term ids from disk"""
+    if not os.path.exists(CANVAS_TERM_CACHE_PATH):
+        return {}
+    try:
+        with open(CANVAS_TERM_CACHE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable term cache {CANVAS_TERM_CACHE_PATH}: {str(e)}")
+        return {}
+
+def _save_cache(cache: Dict) -> None:
+    """Save resolved term ids to disk"""
+    directory = os.path.dirname(CANVAS_TERM_CACHE_PATH)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(CANVAS_TERM_CACHE_PATH, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse a Canvas ISO 8601 timestamp"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _student_key(domain: str, headers: Dict) -> str:
+    """Cache key for one student's token on a domain (the token itself is never stored)"""
+    token = (headers or {}).get("Authorization", "")
+    return f"{domain}:{hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]}"
+
+def _fetch_current_term_ids(domain: str, headers: Dict) -> List[int]:
+    """Find the terms in session now (plus the grace period) from the student's active courses"""
+    url = f"https://{domain}/api/v1/courses"
+    params = {"enrollment_state": "active", "include[]": ["term"]}
+
+    now = datetime.now(timezone.utc)
+    grace = timedelta(days=CANVAS_TERM_GRACE_DAYS)
+    term_ids = set()
+
+    for course in iter_canvas_items(domain, url, headers=headers, params=params):
+        term = course.get("term") or {}
+        start, end = _parse_time(term.get("start_at")), _parse_time(term.get("end_at"))
+        if not (start and end):
+            # Terms without dates (e.g. the default term) follow the course's own dates
+            start, end = _parse_time(course.get("start_at")), _parse_time(course.get("end_at"))
+        if term.get("id") and start and end and start - grace <= now <= end + grace:
+            term_ids.add(term["id"])
+
+    return sorted(term_ids)
+
+def resolve_term_ids(domain: str, headers: Dict) -> Optional[List[int]]:
+    """
+    Get the enrollment term ids to collect for a student.
+
+    CANVAS_TERM_IDS wins when set. Otherwise the terms in session are resolved
+    from the student's own course list (students on one domain can be in
+    different terms) and cached on disk for CANVAS_TERM_CACHE_TTL seconds.
+    Several terms overlap during transition weeks. Returns None when no term
+    could be resolved; DeadlineExceededError is raised to the caller.
+    """
+    if CANVAS_TERM_IDS:
+        return CANVAS_TERM_IDS
+
+    key = _student_key(domain, headers)
+    with _locks_lock:
+        student_lock = _student_locks.setdefault(key, threading.Lock())
+
+    with student_lock:
+        if key in _resolved:
+            return _resolved[key] or None
+
+        with _locks_lock:
+            cache = _load_cache()
+        entry = cache.get(key)
+        if entry and time.time() - entry.get("resolved_at", 0) < CANVAS_TERM_CACHE_TTL:
+            _resolved[key] = entry.get("term_ids", [])
+            return _resolved[key] or None
+
+        try:
+            term_ids = _fetch_current_term_ids(domain, headers)
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            logger.warning(f"Could not resolve current terms for {domain}: {str(e)}")
+            return None
+
+        _resolved[key] = term_ids
+        if term_ids:
+            print(f"📅 Current term(s) on {domain}: {', '.join(str(term_id) for term_id in term_ids)}")
+            # Other students may have saved their terms since this cache was read
+            with _locks_lock:
+                cache = _load_cache()
+                cache[key] = {"term_ids": term_ids, "resolved_at": time.time()}
+                try:
+                    _save_cache(cache)
+                except OSError as e:
+                    logger.warning(f"Could not save term cache {CANVAS_TERM_CACHE_PATH}: {str(e)}")
+        else:
+            logger.warning(f"No current term found on {domain}; falling back to course names")
+        return term_ids or None